@@ -1,234 +1,587 @@
 import time
 import re
 import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from typing import List, Dict, Tuple, Union
 from colorama import Fore, Style
 import logging
 import sys
-from io import StringIO
-from web_scraper import get_web_content, can_fetch
+from web_scraper import get_web_content, can_fetch, MAX_CONTENT_CHARS, PAGE_CACHE_TTL
 from llm_config import get_llm_config
-from llm_response_parser import UltimateLLMResponseParser
-from llm_wrapper import LLMWrapper
+from llm_response_parser import UltimateLLMResponseParser, find_json_object
+from llm_wrapper import LLMWrapper, get_llm_wrapper
+from response_cache import ResponseCache
 from urllib.parse import urlparse
 
-# Set up logging
-log_directory = 'logs'
-if not os.path.exists(log_directory):
-    os.makedirs(log_directory)
-
-# Configure logger
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-log_file = os.path.join(log_directory, 'llama_output.log')
-file_handler = logging.FileHandler(log_file)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-logger.handlers = []
-logger.addHandler(file_handler)
-logger.propagate = False
-
-# Suppress other loggers
-for name in ['root', 'duckduckgo_search', 'requests', 'urllib3']:
-    logging.getLogger(name).setLevel(logging.WARNING)
-    logging.getLogger(name).handlers = []
-    logging.getLogger(name).propagate = False
-
-class OutputRedirector:
-    def __init__(self, stream=None):
-        self.stream = stream or StringIO()
-        self.original_stdout = sys.stdout
-        self.original_stderr = sys.stderr
+logging_configured = False
+
+def configure_logging():
+    # Runs once, on first use rather than at import, and the log file is only opened on the first record
+    global logging_configured
+    if logging_configured:
+        return
+    logging_configured = True
+
+    log_directory = 'logs'
+    if not os.path.exists(log_directory):
+        os.makedirs(log_directory)
+
+    logger.setLevel(logging.INFO)
+    log_file = os.path.join(log_directory, 'llama_output.log')
+    file_handler = logging.FileHandler(log_file, delay=True)
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler.setFormatter(formatter)
+    logger.handlers = []
+    logger.addHandler(file_handler)
+    logger.propagate = False
+
+    # Suppress other loggers
+    for name in ['root', 'duckduckgo_search', 'requests', 'urllib3', 'llama_cpp']:
+        logging.getLogger(name).setLevel(logging.WARNING)
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).propagate = False
+
+# Limit concurrent DuckDuckGo requests across searches to stay under its rate limits
+ddg_semaphore = threading.BoundedSemaphore(2)
+DDG_TIMEOUT = 10  # seconds before a hung DuckDuckGo request is abandoned
+
+# Matches "Search query:" / "Time range:" style lines; a key mentioning "query" takes precedence
+QUERY_FIELD_RE = re.compile(r'^(?:[^:\n]*?(query)|[^:\n]*?(time|range))[^:\n]*:(.*)$', re.IGNORECASE | re.MULTILINE)
+QUERY_STRIP_RE = re.compile(r'["\'\[\]]')
+WHITESPACE_RE = re.compile(r'\s+')
+DIGITS_RE = re.compile(r'\d+')
+# Matches each "Selected Results:", "Promising:" and "Reasoning:" line of a page selection response
+SELECTION_FIELD_RE = re.compile(r'^(Selected Results|Promising|Reasoning):(.*)$', re.MULTILINE)
+
+WORD_RE = re.compile(r'\w+')
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'did', 'do', 'does', 'for', 'from', 'how', 'in', 'is', 'it',
+    'of', 'on', 'or', 'still', 'that', 'the', 'this', 'to', 'was', 'what', 'when', 'where', 'which', 'who', 'why', 'with'
+])
+
+# Only the best-matching search results are shown to the LLM for page selection
+MAX_SELECTION_CANDIDATES = 6
+
+# The first attempt fetches just enough results to fill the selection candidates; retries dig deeper
+def search_result_count(attempt: int) -> int:
+    return min(10, MAX_SELECTION_CANDIDATES + 2 * attempt)
+
+# Scraped text sent to the LLM is capped in total to bound prompt prefill (the scraper already caps each page);
+# the total also shrinks to fit n_ctx, estimating tokens as CHARS_PER_TOKEN characters each
+MAX_TOTAL_CHARS = 12000
+CHARS_PER_TOKEN = 4
+PROMPT_OVERHEAD_TOKENS = 512
+# Tokens kept free beyond the prompt and answer when fitting a prompt to the context
+CONTEXT_RESERVE_TOKENS = 64
+
+# Matches each "Evaluation:", "Decision:" and "Response:" section of an evaluate-and-answer response
+EVALUATION_SECTION_RE = re.compile(r'^(Evaluation|Decision|Response):[ \t]*(.*?)(?=^(?:Evaluation|Decision|Response):|\Z)', re.MULTILINE | re.DOTALL)
+
+# How long cached LLM responses are kept (seconds); prompts embed search results, so old ones rarely match again
+LLM_CACHE_TTL = 7 * 24 * 3600
+# How long cached DuckDuckGo results stay fresh, per time range (seconds)
+DDG_CACHE_TTL = {'d': 3600, 'w': 6 * 3600, 'm': 12 * 3600, 'y': 24 * 3600, 'none': 24 * 3600}
+
+# Upper bound on the robots check and fetch of one page (seconds)
+SCRAPE_TIMEOUT = 30
+
+# Answers are reused when the same question is asked again, for a limited time since web content changes
+ANSWER_CACHE_TTL = 6 * 3600
+# Scraped pages that are mostly full-length (this share of the scraper's per-page cap, on average) and contain
+# this share of the question's keywords as whole words are answered without an evaluation call
+EARLY_ANSWER_MIN_FILL = 0.9
+EARLY_ANSWER_MIN_COVERAGE = 0.6
+FINAL_ANSWER_ERROR_MESSAGE = "I apologize, but I couldn't generate a satisfactory answer based on the available information."
+
+# Stops generation when the model starts writing the next conversation turn itself
+STOP_SEQUENCES = ["\nUser:"]
+# Query and page-selection answers are a single short JSON line, so a blank line means the model is done
+SHORT_ANSWER_STOP_SEQUENCES = STOP_SEQUENCES + ["\n\n"]
+QUERY_MAX_TOKENS = 48
+# Fits the JSON wrapper plus the grammar's 200-character reasoning, so the object is never cut off
+SELECTION_MAX_TOKENS = 256
+
+# GBNF grammars that make llama.cpp emit exactly the response formats the parsers expect
+QUERY_GRAMMAR = r'''
+root ::= "{\"search_query\": \"" [^"\\\n]+ "\", \"time_range\": \"" ("d" | "w" | "m" | "y" | "none") "\"}"
+'''
+
+# Completed with a number rule listing the candidate results, so only results that were shown can be selected
+SELECTION_GRAMMAR = r'''
+root ::= "{\"selected_results\": [" number ", " number "], \"promising\": \"" ("yes" | "no") "\", \"reasoning\": \"" [^"\\\n]{1,200} "\"}"
+'''
+
+EVALUATION_GRAMMAR = r'''
+root ::= "Evaluation: " [^\n]+ "\nDecision: " ("answer\nResponse: " text | "refine\nResponse:")
+text ::= ([^\n] | "\n")+
+'''
+
+# Prompt instructions come first and are byte-identical on every call, with only the
+# variable part appended, so llama.cpp can reuse the cached KV state of the shared prefix
+QUERY_PROMPT_PREFIX = """
+Formulate a concise and effective search query for the user question given at the end.
+Your task:
+1. Create a search query of 2-5 words that will yield relevant results.
+2. Determine if a specific time range is needed for the search.
+Time range options:
+- 'd': Limit results to the past day. Use for very recent events or rapidly changing information.
+- 'w': Limit results to the past week. Use for recent events or topics with frequent updates.
+- 'm': Limit results to the past month. Use for relatively recent information or ongoing events.
+- 'y': Limit results to the past year. Use for annual events or information that changes yearly.
+- 'none': No time limit. Use for historical information or topics not tied to a specific time frame.
+Respond with a single JSON object in exactly this form:
+{"search_query": "[Your 2-5 word query]", "time_range": "[d/w/m/y/none]"}
+Do not provide any additional information or explanation.
+"""
+
+SELECT_PAGES_PROMPT_PREFIX = """
+Given the search results for the user's question below, select the 2 most relevant results to scrape and analyze. Briefly explain your reasoning.
+
+Instructions:
+1. You MUST select exactly 2 result numbers from the search results.
+2. Choose the results that are most likely to contain comprehensive and relevant information to answer the user's question.
+3. Say whether the search results look likely to answer the user's question at all.
+4. Give your reasoning in one short sentence (under 200 characters).
+
+You MUST respond with a single JSON object in EXACTLY this form and nothing else:
+
+{"selected_results": [Two numbers corresponding to the selected results], "promising": "[yes if the results look likely to answer the question, no if none of them seem relevant]", "reasoning": "[One short sentence explaining the selections]"}
+"""
+
+EVALUATE_AND_ANSWER_PROMPT_PREFIX = """
+Evaluate if the scraped content below contains sufficient information to answer the user's question comprehensively, and if it does, answer the question.
+
+Your task:
+1. Determine if the scraped content provides enough relevant and detailed information to answer the user's question thoroughly.
+2. If the information is sufficient, decide to 'answer'. If more information or clarification is needed, decide to 'refine' the search.
+3. If you decide to 'answer', provide a comprehensive and detailed answer using ONLY the information provided in the scraped content. Do not include any references or mention any sources. Answer directly and thoroughly.
+
+Respond using EXACTLY this format:
+Evaluation: [Your evaluation of the scraped content]
+Decision: [ONLY 'answer' if content is sufficient, or 'refine' if more information is needed]
+Response: [Your answer to the question if your decision is 'answer', otherwise leave this blank]
+"""
+
+FINAL_ANSWER_PROMPT_PREFIX = """
+You are an AI assistant. Provide a comprehensive and detailed answer to the question below using ONLY the information provided in the scraped content. Do not include any references or mention any sources. Answer directly and thoroughly.
+
+Important Instructions:
+1. Do not use phrases like "Based on the absence of selected results" or similar.
+2. If the scraped content does not contain enough information to answer the question, say so explicitly and explain what information is missing.
+3. Provide as much relevant detail as possible from the scraped content.
+"""
+
+SYNTHESIZE_PROMPT_PREFIX = """
+After multiple search attempts, we couldn't find a fully satisfactory answer to the user's question given below.
+
+Please provide the best possible answer you can, acknowledging any limitations or uncertainties.
+If appropriate, suggest ways the user might refine their question or where they might find more information.
+
+Respond in a clear, concise, and informative manner.
+"""
+
+# Color only when writing to a terminal; set NO_COLOR to disable it there too
+USE_COLOR = sys.stdout.isatty() and os.environ.get('NO_COLOR') is None
+
+def colorize(message: str, color: str) -> str:
+    return f"{color}{message}{Style.RESET_ALL}" if USE_COLOR else message
+
+def cprint(message: str, color: str = ""):
+    print(colorize(message, color) if color else message)
+
+# Status messages shown on every attempt, colored once at import
+THINKING_MESSAGE = colorize("🧠 Thinking...", Fore.MAGENTA)
+SEARCHING_MESSAGE = colorize("📝 Searching...", Fore.MAGENTA)
+SCRAPING_MESSAGE = colorize("⚙️ Scraping selected pages...", Fore.MAGENTA)
+
+class ProgressIndicator:
+    def __init__(self, message, interval=0.5):
+        self.message = message
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.stream = None
+        self.thread = None
+
+    def _animate(self):
+        while not self.stop_event.wait(self.interval):
+            self.stream.write(".")
+            self.stream.flush()
 
     def __enter__(self):
-        sys.stdout = self.stream
-        sys.stderr = self.stream
-        return self.stream
+        self.stream = sys.stdout
+        self.stream.write(self.message)
+        self.stream.flush()
+        # Dots only mean something on a terminal; redirected output gets just the message
+        if self.stream.isatty():
+            self.thread = threading.Thread(target=self._animate, daemon=True)
+            self.thread.start()
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        sys.stdout = self.original_stdout
-        sys.stderr = self.original_stderr
+        self.stop()
+
+    def stop(self):
+        # Safe to call early (e.g. when an answer starts streaming); the exit call then does nothing
+        if self.stop_event.is_set():
+            return
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.stream.write("\n")
+        self.stream.flush()
 
 class EnhancedSelfImprovingSearch:
-    def __init__(self, llm: LLMWrapper, parser: UltimateLLMResponseParser, max_attempts: int = 5):
+    def __init__(self, llm: LLMWrapper, parser: UltimateLLMResponseParser, max_attempts: int = 5, verbose: bool = True):
+        configure_logging()
         self.llm = llm
         self.parser = parser
         self.max_attempts = max_attempts
+        # With verbose off, search results and scraped pages go to the log instead of the console
+        self.verbose = verbose
         self.llm_config = get_llm_config()
+        self.query_batch_size = self.llm_config.get('query_batch_size', 1)
+        # Grammar-constrained output always parses, so only unconstrained backends need parse retries
+        self.max_parse_retries = 1 if llm.supports_grammar else 3
+        # Speculative next-attempt queries only pay off when the backend runs generations concurrently (Ollama)
+        self.speculate = llm.llm_type == 'ollama'
+        self.model_id = self.llm_config.get('model_path') or self.llm_config.get('model_name')
+        context_tokens = self.llm_config.get('n_ctx', 2048) - 1024 - PROMPT_OVERHEAD_TOKENS
+        self.max_content_chars = max(0, min(MAX_TOTAL_CHARS, context_tokens * CHARS_PER_TOKEN))
+        self.cache = ResponseCache()
+        self.ddgs = None
+        self.ddgs_lock = threading.Lock()
+        self.answer_streamed = False
+        self.searched_queries = set()
+        self.seen_result_urls = set()
+        self.robots_prefetch = {}
+        self.progress_indicator = None
 
     @staticmethod
     def initialize_llm():
-        llm_wrapper = LLMWrapper()
+        llm_wrapper = get_llm_wrapper()
         return llm_wrapper
 
-    def print_thinking(self):
-        print(Fore.MAGENTA + "🧠 Thinking..." + Style.RESET_ALL)
-
-    def print_searching(self):
-        print(Fore.MAGENTA + "📝 Searching..." + Style.RESET_ALL)
-
-    def search_and_improve(self, user_query: str) -> str:
-        attempt = 0
-        while attempt < self.max_attempts:
-            print(f"\n{Fore.CYAN}Search attempt {attempt + 1}:{Style.RESET_ALL}")
-            self.print_searching()
-
-            try:
-                formulated_query, time_range = self.formulate_query(user_query, attempt)
-
-                print(f"{Fore.YELLOW}Original query: {user_query}{Style.RESET_ALL}")
-                print(f"{Fore.YELLOW}Formulated query: {formulated_query}{Style.RESET_ALL}")
-                print(f"{Fore.YELLOW}Time range: {time_range}{Style.RESET_ALL}")
-
-                if not formulated_query:
-                    print(f"{Fore.RED}Error: Empty search query. Retrying...{Style.RESET_ALL}")
-                    attempt += 1
-                    continue
-
-                search_results = self.perform_search(formulated_query, time_range)
-
-                if not search_results:
-                    print(f"{Fore.RED}No results found. Retrying with a different query...{Style.RESET_ALL}")
-                    attempt += 1
-                    continue
-
-                self.display_search_results(search_results)
+    def llm_cache_key(self, prompt: str, max_tokens: int, cache_tag: str = "") -> str:
+        return self.cache.make_key(self.model_id, max_tokens, cache_tag, prompt)
+
+    def cached_generate(self, prompt: str, cache_tag: str = "", is_valid=bool, generate=None, **kwargs) -> str:
+        # Only responses accepted by is_valid are stored, so retries never replay a bad response
+        key = self.llm_cache_key(prompt, kwargs.get('max_tokens'), cache_tag)
+        response_text = self.cache.get('llm', key)
+        if response_text is not None:
+            logger.info("LLM response served from cache")
+            return response_text
+        response_text = (generate or self.llm.generate)(prompt, **kwargs)
+        if is_valid(response_text):
+            self.cache.set('llm', key, response_text, expire=LLM_CACHE_TTL)
+        return response_text
 
-                selected_urls = self.select_relevant_pages(search_results, user_query)
-
-                if not selected_urls:
-                    print(f"{Fore.RED}No relevant URLs found. Retrying...{Style.RESET_ALL}")
-                    attempt += 1
-                    continue
+    @staticmethod
+    def retry_kwargs(retry: int) -> Dict[str, int]:
+        # Retries reuse the exact same prompt, so vary the seed to avoid sampling the rejected output again
+        return {'seed': retry} if retry else {}
 
-                print(Fore.MAGENTA + "⚙️ Scraping selected pages..." + Style.RESET_ALL)
-                # Scraping is done without OutputRedirector to ensure messages are visible
-                scraped_content = self.scrape_content(selected_urls)
+    @staticmethod
+    def greedy_retry_kwargs(retry: int) -> Dict[str, float]:
+        # Picking from a fixed list decodes greedily on the first try; retries fall back to seeded sampling
+        return {'seed': retry} if retry else {'temperature': 0.0}
 
-                if not scraped_content:
-                    print(f"{Fore.RED}Failed to scrape content. Retrying...{Style.RESET_ALL}")
-                    attempt += 1
-                    continue
+    def remember_answer(self, user_query: str, answer: str) -> str:
+        if answer != FINAL_ANSWER_ERROR_MESSAGE:
+            self.cache.set('answer', self.question_key(user_query), answer, expire=ANSWER_CACHE_TTL)
+        return answer
 
-                self.display_scraped_content(scraped_content)
+    def question_key(self, user_query: str) -> str:
+        # Only case, whitespace and punctuation are normalized; question words and word order change the question
+        words = WORD_RE.findall(user_query.lower())
+        return self.cache.make_key(self.model_id, ' '.join(words) if words else user_query.strip().lower())
 
-                self.print_thinking()
+    def thinking_indicator(self):
+        self.progress_indicator = ProgressIndicator(THINKING_MESSAGE)
+        return self.progress_indicator
 
-                with OutputRedirector() as output:
-                    evaluation, decision = self.evaluate_scraped_content(user_query, scraped_content)
-                llm_output = output.getvalue()
-                logger.info(f"LLM Output in evaluate_scraped_content:\n{llm_output}")
+    def searching_indicator(self):
+        self.progress_indicator = ProgressIndicator(SEARCHING_MESSAGE)
+        return self.progress_indicator
 
-                print(f"{Fore.MAGENTA}Evaluation: {evaluation}{Style.RESET_ALL}")
-                print(f"{Fore.MAGENTA}Decision: {decision}{Style.RESET_ALL}")
+    def search_and_improve(self, user_query: str) -> str:
+        return asyncio.run(self.search_and_improve_async(user_query))
+
+    async def search_and_improve_async(self, user_query: str) -> str:
+        self.answer_streamed = False
+        cached_answer = self.cache.get('answer', self.question_key(user_query))
+        if cached_answer is not None:
+            logger.info(f"Answer for '{user_query}' served from cache")
+            return cached_answer
+        attempt = 0
+        queued_queries = []
+        next_queries = None
+        # A dedicated executor so asyncio.run does not wait on an unused speculative query
+        speculative_executor = ThreadPoolExecutor(max_workers=1)
+        robots_executor = ThreadPoolExecutor(max_workers=4)
+        self.searched_queries = set()
+        self.seen_result_urls = set()
+        self.robots_prefetch = {}
+        try:
+            while attempt < self.max_attempts:
+                cprint(f"\nSearch attempt {attempt + 1}:", Fore.CYAN)
+
+                try:
+                    with self.searching_indicator():
+                        if not queued_queries and next_queries is not None:
+                            # Cleared before awaiting so a failed prefetch is not awaited again on every later attempt
+                            pending, next_queries = next_queries, None
+                            try:
+                                queued_queries = await pending
+                            except Exception as e:
+                                logger.warning(f"Speculative query prefetch failed, formulating again: {str(e)}")
+                        if not queued_queries:
+                            batch_end = min(attempt + self.query_batch_size, self.max_attempts)
+                            queued_queries = await asyncio.to_thread(self.formulate_queries, user_query, list(range(attempt, batch_end)))
+                        formulated_query, time_range = queued_queries.pop(0)
+
+                    cprint(f"Original query: {user_query}", Fore.YELLOW)
+                    cprint(f"Formulated query: {formulated_query}", Fore.YELLOW)
+                    cprint(f"Time range: {time_range}", Fore.YELLOW)
+
+                    if not formulated_query:
+                        cprint("Error: Empty search query. Retrying...", Fore.RED)
+                        attempt += 1
+                        continue
+
+                    if (formulated_query, time_range) in self.searched_queries:
+                        cprint("This query was already searched. Retrying with a different query...", Fore.RED)
+                        attempt += 1
+                        continue
+                    self.searched_queries.add((formulated_query, time_range))
+
+                    search_results = await self.perform_search_async(formulated_query, time_range, attempt)
+
+                    if not search_results:
+                        cprint("No results found. Retrying with a different query...", Fore.RED)
+                        attempt += 1
+                        continue
+
+                    self.display_search_results(search_results)
+
+                    # Warm the per-host robots.txt cache while the LLM picks pages, so the robots filter finds it ready.
+                    # One check per host, on an executor that is not waited for when the search returns.
+                    first_url_per_host = {}
+                    for result in search_results:
+                        first_url_per_host.setdefault(urlparse(result['href']).netloc, result['href'])
+                    self.robots_prefetch = {host: robots_executor.submit(can_fetch, url) for host, url in first_url_per_host.items()}
+
+                    # Prepare the next attempt's query and search results while this one is evaluated, in case it says 'refine'
+                    if self.speculate and next_queries is None and not queued_queries and attempt + 1 < self.max_attempts:
+                        next_queries = asyncio.get_running_loop().run_in_executor(
+                            speculative_executor, self.prefetch_attempt, user_query, attempt + 1)
+
+                    selected_urls, promising = await asyncio.to_thread(self.select_and_preassess, search_results, user_query)
+
+                    if not selected_urls:
+                        cprint("No relevant URLs found. Retrying...", Fore.RED)
+                        attempt += 1
+                        continue
+
+                    # The last attempt is always scraped and evaluated so it can still produce an answer
+                    if not promising and attempt + 1 < self.max_attempts:
+                        cprint("Search results don't look relevant. Refining search...", Fore.YELLOW)
+                        attempt += 1
+                        continue
+
+                    print(SCRAPING_MESSAGE)
+                    scraped_content = await self.scrape_content_async(selected_urls)
+
+                    if not scraped_content:
+                        cprint("Failed to scrape content. Retrying...", Fore.RED)
+                        attempt += 1
+                        continue
+
+                    self.display_scraped_content(scraped_content)
+
+                    if self.content_covers_query(user_query, scraped_content):
+                        # The pages clearly cover the question, so skip the evaluation call and answer directly
+                        cprint("Scraped content covers the question. Proceeding to answer.", Fore.MAGENTA)
+                        answer = await asyncio.to_thread(self.generate_final_answer, user_query, scraped_content)
+                        return self.remember_answer(user_query, answer)
+
+                    with self.thinking_indicator():
+                        evaluation, decision, answer = await asyncio.to_thread(self.evaluate_and_answer, user_query, scraped_content)
+
+                    # A streamed answer already printed these before its text
+                    if not self.answer_streamed:
+                        cprint(f"Evaluation: {evaluation}", Fore.MAGENTA)
+                        cprint(f"Decision: {decision}", Fore.MAGENTA)
+
+                    if decision == "answer":
+                        if answer:
+                            logger.info(f"LLM Response:\n{answer}")
+                        else:
+                            answer = await asyncio.to_thread(self.generate_final_answer, user_query, scraped_content)
+                        return self.remember_answer(user_query, answer)
+                    elif decision == "refine":
+                        cprint("Refining search...", Fore.YELLOW)
+                        attempt += 1
+                    else:
+                        cprint("Unexpected decision. Proceeding to answer.", Fore.RED)
+                        return await asyncio.to_thread(self.generate_final_answer, user_query, scraped_content)
 
-                if decision == "answer":
-                    return self.generate_final_answer(user_query, scraped_content)
-                elif decision == "refine":
-                    print(f"{Fore.YELLOW}Refining search...{Style.RESET_ALL}")
+                except Exception as e:
+                    cprint("An error occurred during search attempt. Check the log file for details.", Fore.RED)
+                    logger.error(f"An error occurred during search: {str(e)}", exc_info=True)
                     attempt += 1
-                else:
-                    print(f"{Fore.RED}Unexpected decision. Proceeding to answer.{Style.RESET_ALL}")
-                    return self.generate_final_answer(user_query, scraped_content)
 
-            except Exception as e:
-                print(f"{Fore.RED}An error occurred during search attempt. Check the log file for details.{Style.RESET_ALL}")
-                logger.error(f"An error occurred during search: {str(e)}", exc_info=True)
-                attempt += 1
-
-        return self.synthesize_final_answer(user_query)
+            return await asyncio.to_thread(self.synthesize_final_answer, user_query)
+        finally:
+            speculative_executor.shutdown(wait=False)
+            robots_executor.shutdown(wait=False, cancel_futures=True)
 
     def evaluate_scraped_content(self, user_query: str, scraped_content: Dict[str, str]) -> Tuple[str, str]:
-        user_query_short = user_query[:200]
-        prompt = f"""
-Evaluate if the following scraped content contains sufficient information to answer the user's question comprehensively:
+        # Kept for backward compatibility; the search loop uses evaluate_and_answer
+        evaluation, decision, _ = self.evaluate_and_answer(user_query, scraped_content)
+        return evaluation, decision
 
+    def evaluate_and_answer(self, user_query: str, scraped_content: Dict[str, str]) -> Tuple[str, str, str]:
+        user_query_short = user_query[:200]
+        prompt = self.fit_to_context(lambda content: EVALUATE_AND_ANSWER_PROMPT_PREFIX + f"""
 User's question: "{user_query_short}"
 
 Scraped Content:
-{self.format_scraped_content(scraped_content)}
-
-Your task:
-1. Determine if the scraped content provides enough relevant and detailed information to answer the user's question thoroughly.
-2. If the information is sufficient, decide to 'answer'. If more information or clarification is needed, decide to 'refine' the search.
-
-Respond using EXACTLY this format:
-Evaluation: [Your evaluation of the scraped content]
-Decision: [ONLY 'answer' if content is sufficient, or 'refine' if more information is needed]
-"""
-        max_retries = 3
+{self.format_scraped_content(content)}
+""", scraped_content, max_tokens=1024)
+        max_retries = self.max_parse_retries
         for attempt in range(max_retries):
             try:
-                response_text = self.llm.generate(prompt, max_tokens=200, stop=None)
-                evaluation, decision = self.parse_evaluation_response(response_text)
-                if decision in ['answer', 'refine']:
-                    return evaluation, decision
+                response_text = self.cached_generate(prompt, is_valid=lambda text: self.parse_evaluation_response(text)[1] in ['answer', 'refine'], generate=self.generate_evaluation, max_tokens=1024, stop=STOP_SEQUENCES, grammar=EVALUATION_GRAMMAR, **self.retry_kwargs(attempt))
+                logger.info(f"LLM Output in evaluate_and_answer:\n{response_text}")
+                evaluation, decision, answer = self.parse_evaluation_and_answer(response_text)
+                if decision == 'answer':
+                    return evaluation, decision, answer
+                if decision == 'refine':
+                    return evaluation, decision, ""
             except Exception as e:
-                logger.warning(f"Error in evaluate_scraped_content (attempt {attempt + 1}): {str(e)}")
-
-        logger.warning("Failed to get a valid decision in evaluate_scraped_content. Defaulting to 'refine'.")
-        return "Failed to evaluate content.", "refine"
+                logger.warning(f"Error in evaluate_and_answer (attempt {attempt + 1}): {str(e)}")
+
+        logger.warning("Failed to get a valid decision in evaluate_and_answer. Defaulting to 'refine'.")
+        return "Failed to evaluate content.", "refine", ""
+
+    def generate_evaluation(self, prompt: str, **kwargs) -> str:
+        # Stream so a 'refine' decision stops generation at the Response section instead of running to max_tokens,
+        # and an 'answer' decision prints the Response text as it arrives
+        response_text = ""
+        decision_checked = False
+        answer_start = None
+        streaming = False
+        for chunk in self.llm.generate_stream(prompt, **kwargs):
+            response_text += chunk
+            if not decision_checked and 'Response:' in response_text:
+                decision_checked = True
+                evaluation, decision = self.parse_evaluation_response(response_text)
+                if decision == 'refine':
+                    break
+                if decision == 'answer':
+                    answer_start = response_text.index('Response:') + len('Response:')
+            if answer_start is not None:
+                new_text = response_text[answer_start:]
+                if not streaming:
+                    new_text = new_text.lstrip()
+                    if not new_text:
+                        continue
+                    streaming = True
+                    if self.progress_indicator is not None:
+                        self.progress_indicator.stop()
+                    cprint(f"Evaluation: {evaluation}", Fore.MAGENTA)
+                    cprint(f"Decision: {decision}", Fore.MAGENTA)
+                    cprint("\n🤖 Assistant:", Fore.GREEN)
+                print(new_text, end='', flush=True)
+                answer_start = len(response_text)
+        if streaming:
+            print()
+            self.answer_streamed = True
+        return response_text.strip()
 
     def parse_evaluation_response(self, response: str) -> Tuple[str, str]:
-        evaluation = ""
-        decision = ""
-        for line in response.strip().split('\n'):
-            if line.startswith('Evaluation:'):
-                evaluation = line.split(':', 1)[1].strip()
-            elif line.startswith('Decision:'):
-                decision = line.split(':', 1)[1].strip().lower()
+        evaluation, decision, _ = self.parse_evaluation_and_answer(response)
         return evaluation, decision
 
+    def parse_evaluation_and_answer(self, response: str) -> Tuple[str, str, str]:
+        sections = {key.lower(): value.strip() for key, value in EVALUATION_SECTION_RE.findall(response.strip())}
+        return sections.get('evaluation', ""), sections.get('decision', "").lower(), sections.get('response', "")
+
     def formulate_query(self, user_query: str, attempt: int) -> Tuple[str, str]:
-        user_query_short = user_query[:200]
-        prompt = f"""
-Based on the following user question, formulate a concise and effective search query:
-"{user_query_short}"
-Your task:
-1. Create a search query of 2-5 words that will yield relevant results.
-2. Determine if a specific time range is needed for the search.
-Time range options:
-- 'd': Limit results to the past day. Use for very recent events or rapidly changing information.
-- 'w': Limit results to the past week. Use for recent events or topics with frequent updates.
-- 'm': Limit results to the past month. Use for relatively recent information or ongoing events.
-- 'y': Limit results to the past year. Use for annual events or information that changes yearly.
-- 'none': No time limit. Use for historical information or topics not tied to a specific time frame.
-Respond in the following format:
-Search query: [Your 2-5 word query]
-Time range: [d/w/m/y/none]
-Do not provide any additional information or explanation.
-"""
-        max_retries = 3
+        prompt = self.build_query_prompt(user_query)
+        max_retries = self.max_parse_retries
         for retry in range(max_retries):
-            with OutputRedirector() as output:
-                response_text = self.llm.generate(prompt, max_tokens=50, stop=None)
-            llm_output = output.getvalue()
-            logger.info(f"LLM Output in formulate_query:\n{llm_output}")
+            # The prompt is the same on every attempt, so the attempt number keeps cached queries distinct
+            response_text = self.cached_generate(prompt, cache_tag=f"attempt {attempt}", is_valid=lambda text: bool(self.parse_query_response(text)[0]), max_tokens=QUERY_MAX_TOKENS, stop=SHORT_ANSWER_STOP_SEQUENCES, grammar=QUERY_GRAMMAR, json_format=True, **self.retry_kwargs(retry))
+            logger.info(f"LLM Output in formulate_query:\n{response_text}")
             query, time_range = self.parse_query_response(response_text)
             if query and time_range:
                 return query, time_range
         return self.fallback_query(user_query), "none"
 
+    def formulate_queries(self, user_query: str, attempts: List[int]) -> List[Tuple[str, str]]:
+        if len(attempts) == 1:
+            return [self.formulate_query(user_query, attempts[0])]
+
+        prompt = self.build_query_prompt(user_query)
+        keys = [self.llm_cache_key(prompt, QUERY_MAX_TOKENS, f"attempt {attempt}") for attempt in attempts]
+        response_texts = [self.cache.get('llm', key) for key in keys]
+        uncached = [i for i, response_text in enumerate(response_texts) if response_text is None]
+
+        # Speculatively formulate queries for several attempts in one batched call
+        if uncached:
+            generated = self.llm.generate_batch([prompt] * len(uncached), max_tokens=QUERY_MAX_TOKENS, stop=SHORT_ANSWER_STOP_SEQUENCES, grammar=QUERY_GRAMMAR, json_format=True)
+            logger.info(f"LLM Output in formulate_queries:\n{generated}")
+            for i, response_text in zip(uncached, generated):
+                response_texts[i] = response_text
+
+        queries = []
+        for attempt, key, response_text in zip(attempts, keys, response_texts):
+            query, time_range = self.parse_query_response(response_text)
+            if query and time_range:
+                self.cache.set('llm', key, response_text, expire=LLM_CACHE_TTL)
+            else:
+                query, time_range = self.formulate_query(user_query, attempt)
+            queries.append((query, time_range))
+        return queries
+
+    def build_query_prompt(self, user_query: str) -> str:
+        user_query_short = user_query[:200]
+        return QUERY_PROMPT_PREFIX + f"""
+User question: "{user_query_short}"
+"""
+
     def parse_query_response(self, response: str) -> Tuple[str, str]:
+        parsed = self.parse_json_object(response)
+        if parsed is not None:
+            return self.clean_query(str(parsed.get('search_query', '')).strip()), self.validate_time_range(str(parsed.get('time_range', 'none')).strip())
+        # Free-form fallback for models that ignore the JSON instruction
         query = ""
         time_range = "none"
-        for line in response.strip().split('\n'):
-            if ":" in line:
-                key, value = line.split(":", 1)
-                key = key.strip().lower()
-                value = value.strip()
-                if "query" in key:
-                    query = self.clean_query(value)
-                elif "time" in key or "range" in key:
-                    time_range = self.validate_time_range(value)
+        for is_query, _, value in QUERY_FIELD_RE.findall(response):
+            if is_query:
+                query = self.clean_query(value.strip())
+            else:
+                time_range = self.validate_time_range(value.strip())
         return query, time_range
 
-    def clean_query(self, query: str) -> str:
-        query = re.sub(r'["\'\[\]]', '', query)
-        query = re.sub(r'\s+', ' ', query)
+    @staticmethod
+    def parse_json_object(response: str) -> Union[Dict, None]:
+        return find_json_object(response)
+
+    @staticmethod
+    def clean_query(query: str) -> str:
+        query = QUERY_STRIP_RE.sub('', query)
+        query = WHITESPACE_RE.sub(' ', query)
         return query.strip()[:100]
 
-    def validate_time_range(self, time_range: str) -> str:
+    @staticmethod
+    def validate_time_range(time_range: str) -> str:
         valid_ranges = ['d', 'w', 'm', 'y', 'none']
         time_range = time_range.lower()
         return time_range if time_range in valid_ranges else 'none'
@@ -237,191 +590,369 @@ Do not provide any additional information or explanation.
         words = user_query.split()
         return " ".join(words[:5])
 
-    def perform_search(self, query: str, time_range: str) -> List[Dict]:
+    def perform_search(self, query: str, time_range: str, attempt: int = 0) -> List[Dict]:
         if not query:
             return []
 
-        from duckduckgo_search import DDGS
+        try:
+            results = self.fetch_search_results(query, time_range, search_result_count(attempt))
+        except Exception as e:
+            cprint(f"Search error: {str(e)}", Fore.RED)
+            return []
 
-        with DDGS() as ddgs:
+        # Drop duplicate URLs within this search and pages already returned by earlier attempts
+        unique_results = []
+        for result in results:
+            if result['href'] not in self.seen_result_urls:
+                self.seen_result_urls.add(result['href'])
+                # Result dicts are fresh from DDGS or the cache, so they can be numbered in place
+                result['number'] = len(unique_results) + 1
+                unique_results.append(result)
+
+        cprint(f"Search query sent to DuckDuckGo: {query}", Fore.GREEN)
+        cprint(f"Time range sent to DuckDuckGo: {time_range}", Fore.GREEN)
+        cprint(f"Number of results: {len(unique_results)}", Fore.GREEN)
+        return unique_results
+
+    def fetch_search_results(self, query: str, time_range: str, max_results: int) -> List[Dict]:
+        cache_key = self.cache.make_key(query, time_range, max_results)
+        results = self.cache.get('ddg', cache_key)
+        if results is not None:
+            logger.info(f"DDG results for '{query}' ({time_range}) served from cache")
+            return results
+        try:
+            results = self.ddgs_text(query, time_range, max_results)
+        except Exception as e:
+            # The shared session may have gone stale; retry once on a fresh one
+            logger.warning(f"DDG search failed, recreating session: {str(e)}")
+            self.close_ddgs()
+            results = self.ddgs_text(query, time_range, max_results)
+        if results:
+            self.cache.set('ddg', cache_key, results, expire=DDG_CACHE_TTL.get(time_range, DDG_CACHE_TTL['none']))
+        return results
+
+    def prefetch_attempt(self, user_query: str, attempt: int) -> List[Tuple[str, str]]:
+        # Runs while the current attempt is evaluated: formulate the next query and warm the search cache for it
+        queries = self.formulate_queries(user_query, [attempt])
+        query, time_range = queries[0]
+        if query and (query, time_range) not in self.searched_queries:
             try:
-                with OutputRedirector() as output:
-                    if time_range and time_range != 'none':
-                        results = list(ddgs.text(query, timelimit=time_range, max_results=10))
-                    else:
-                        results = list(ddgs.text(query, max_results=10))
-                ddg_output = output.getvalue()
-                logger.info(f"DDG Output in perform_search:\n{ddg_output}")
-                print(f"{Fore.GREEN}Search query sent to DuckDuckGo: {query}{Style.RESET_ALL}")
-                print(f"{Fore.GREEN}Time range sent to DuckDuckGo: {time_range}{Style.RESET_ALL}")
-                print(f"{Fore.GREEN}Number of results: {len(results)}{Style.RESET_ALL}")
-                return [{'number': i+1, **result} for i, result in enumerate(results)]
+                self.fetch_search_results(query, time_range, search_result_count(attempt))
             except Exception as e:
-                print(f"{Fore.RED}Search error: {str(e)}{Style.RESET_ALL}")
-                return []
+                logger.warning(f"Prefetching search results for '{query}' failed: {str(e)}")
+        return queries
+
+    def ddgs_text(self, query: str, time_range: str, max_results: int) -> List[Dict]:
+        # Searches may run on several worker threads, so the shared session is created and replaced under a lock
+        with self.ddgs_lock:
+            if self.ddgs is None:
+                from duckduckgo_search import DDGS
+                self.ddgs = DDGS(timeout=DDG_TIMEOUT)
+            ddgs = self.ddgs
+        with ddg_semaphore:
+            # islice stops consuming once enough results arrived, whether text() returns a list or a generator
+            if time_range and time_range != 'none':
+                return list(islice(ddgs.text(query, timelimit=time_range, max_results=max_results), max_results))
+            return list(islice(ddgs.text(query, max_results=max_results), max_results))
+
+    def close_ddgs(self):
+        with self.ddgs_lock:
+            if self.ddgs is not None:
+                self.ddgs.__exit__(None, None, None)
+                self.ddgs = None
+
+    def close(self):
+        self.close_ddgs()
+        self.cache.close()
+
+    async def perform_search_async(self, query: str, time_range: str, attempt: int = 0) -> List[Dict]:
+        # DDGS is blocking, so run it off the event loop to overlap with other searches
+        return await asyncio.to_thread(self.perform_search, query, time_range, attempt)
 
     def display_search_results(self, results: List[Dict]):
-        print(f"\n{Fore.CYAN}Search Results:{Style.RESET_ALL}")
+        if not self.verbose:
+            logger.debug(f"Search results:\n{self.format_results(results)}")
+            return
+        cprint("\nSearch Results:", Fore.CYAN)
         for result in results:
-            print(f"{Fore.GREEN}Result {result['number']}:{Style.RESET_ALL}")
+            cprint(f"Result {result['number']}:", Fore.GREEN)
             print(f"Title: {result.get('title', 'N/A')}")
-            print(f"Snippet: {result.get('body', 'N/A')[:200]}...")
+            print(f"Snippet: {self.format_snippet(result.get('body', 'N/A'))}")
             print(f"URL: {result.get('href', 'N/A')}\n")
 
     def select_relevant_pages(self, search_results: List[Dict], user_query: str) -> List[str]:
-        prompt = f"""
-Given the following search results for the user's question: "{user_query}"
-Select the 2 most relevant results to scrape and analyze. Explain your reasoning for each selection.
+        return self.select_and_preassess(search_results, user_query)[0]
 
-Search Results:
-{self.format_results(search_results)}
+    def select_and_preassess(self, search_results: List[Dict], user_query: str) -> Tuple[List[str], bool]:
+        # One call both picks the pages and predicts whether they can answer the question,
+        # so hopeless results are refined without paying for scraping and evaluation
+        search_results = self.rank_results(search_results, user_query)
+        candidates = search_results[:MAX_SELECTION_CANDIDATES]
+        candidate_numbers = {result['number'] for result in candidates}
+        prompt = SELECT_PAGES_PROMPT_PREFIX + f"""
+User's question: "{user_query}"
 
-Instructions:
-1. You MUST select exactly 2 result numbers from the search results.
-2. Choose the results that are most likely to contain comprehensive and relevant information to answer the user's question.
-3. Provide a brief reason for each selection.
-
-You MUST respond using EXACTLY this format and nothing else:
-
-Selected Results: [Two numbers corresponding to the selected results]
-Reasoning: [Your reasoning for the selections]
+Search Results:
+{self.format_results(candidates)}
 """
 
         max_retries = 3
         for retry in range(max_retries):
-            with OutputRedirector() as output:
-                response_text = self.llm.generate(prompt, max_tokens=200, stop=None)
-            llm_output = output.getvalue()
-            logger.info(f"LLM Output in select_relevant_pages:\n{llm_output}")
+            response_text = self.llm.generate(prompt, max_tokens=SELECTION_MAX_TOKENS, stop=SHORT_ANSWER_STOP_SEQUENCES, grammar=self.selection_grammar(candidate_numbers), json_format=True, **self.greedy_retry_kwargs(retry))
+            logger.info(f"LLM Output in select_and_preassess:\n{response_text}")
 
             parsed_response = self.parse_page_selection_response(response_text)
-            if parsed_response and self.validate_page_selection_response(parsed_response, len(search_results)):
-                selected_urls = [result['href'] for result in search_results if result['number'] in parsed_response['selected_results']]
+            if parsed_response and self.validate_page_selection_response(parsed_response, candidate_numbers):
+                selected_urls = [result['href'] for result in candidates if result['number'] in parsed_response['selected_results']]
 
-                allowed_urls = [url for url in selected_urls if can_fetch(url)]
+                allowed_urls = self.filter_allowed_urls(selected_urls)
                 if allowed_urls:
-                    return allowed_urls
+                    return allowed_urls, parsed_response['promising']
                 else:
-                    print(f"{Fore.YELLOW}Warning: All selected URLs are disallowed by robots.txt. Retrying selection.{Style.RESET_ALL}")
+                    cprint("Warning: All selected URLs are disallowed by robots.txt. Retrying selection.", Fore.YELLOW)
             else:
-                print(f"{Fore.YELLOW}Warning: Invalid page selection. Retrying.{Style.RESET_ALL}")
+                cprint("Warning: Invalid page selection. Retrying.", Fore.YELLOW)
+
+        cprint("Warning: All attempts to select relevant pages failed. Falling back to top allowed results.", Fore.YELLOW)
+        allowed_urls = self.filter_allowed_urls([result['href'] for result in search_results], limit=2)
+        return allowed_urls, True
 
-        print(f"{Fore.YELLOW}Warning: All attempts to select relevant pages failed. Falling back to top allowed results.{Style.RESET_ALL}")
-        allowed_urls = [result['href'] for result in search_results if can_fetch(result['href'])][:2]
+    @staticmethod
+    def selection_grammar(numbers: set) -> str:
+        return SELECTION_GRAMMAR + "number ::= " + " | ".join(f'"{number}"' for number in sorted(numbers)) + "\n"
+
+    def filter_allowed_urls(self, urls: List[str], limit: int = None) -> List[str]:
+        # robots.txt checks are independent requests, so run them concurrently and keep the input order
+        executor = ThreadPoolExecutor(max_workers=10)
+        futures = [executor.submit(self.robots_allowed, url) for url in urls]
+        allowed_urls = []
+        try:
+            for url, future in zip(urls, futures):
+                if future.result():
+                    allowed_urls.append(url)
+                    if limit is not None and len(allowed_urls) >= limit:
+                        break
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
         return allowed_urls
 
+    def robots_allowed(self, url: str) -> bool:
+        # Waits for the host's robots.txt prefetch, if one is running, so the file is not downloaded a second time
+        prefetch = self.robots_prefetch.get(urlparse(url).netloc)
+        if prefetch is not None:
+            try:
+                prefetch.result()
+            except Exception:
+                pass  # Cancelled or failed; can_fetch checks again
+        return can_fetch(url)
+
     def parse_page_selection_response(self, response: str) -> Dict[str, Union[List[int], str]]:
-        lines = response.strip().split('\n')
-        parsed = {}
-        for line in lines:
-            if line.startswith('Selected Results:'):
-                parsed['selected_results'] = [int(num.strip()) for num in re.findall(r'\d+', line)]
-            elif line.startswith('Reasoning:'):
-                parsed['reasoning'] = line.split(':', 1)[1].strip()
-        return parsed if 'selected_results' in parsed and 'reasoning' in parsed else None
-
-    def validate_page_selection_response(self, parsed_response: Dict[str, Union[List[int], str]], num_results: int) -> bool:
-        if len(parsed_response['selected_results']) != 2:
+        parsed = self.parse_json_object(response)
+        if parsed is not None and 'selected_results' in parsed and 'reasoning' in parsed:
+            try:
+                selected_results = [int(num) for num in parsed['selected_results']]
+            except (TypeError, ValueError):
+                return None
+            return {
+                'selected_results': selected_results,
+                'reasoning': str(parsed['reasoning']).strip(),
+                'promising': not str(parsed.get('promising', '')).strip().lower().startswith('no'),
+            }
+        # Free-form fallback for models that ignore the JSON instruction
+        fields = dict(SELECTION_FIELD_RE.findall(response.strip()))
+        if 'Selected Results' not in fields or 'Reasoning' not in fields:
+            return None
+        return {
+            'selected_results': [int(num) for num in DIGITS_RE.findall(fields['Selected Results'])],
+            'reasoning': fields['Reasoning'].strip(),
+            # Without a usable pre-assessment the pages are scraped and evaluated as usual
+            'promising': not fields.get('Promising', '').strip().lower().startswith('no'),
+        }
+
+    def validate_page_selection_response(self, parsed_response: Dict[str, Union[List[int], str]], valid_numbers: set) -> bool:
+        if len(set(parsed_response['selected_results'])) != 2:
             return False
-        if any(num < 1 or num > num_results for num in parsed_response['selected_results']):
+        if any(num not in valid_numbers for num in parsed_response['selected_results']):
             return False
         return True
 
-    def format_results(self, results: List[Dict]) -> str:
-        formatted_results = []
-        for result in results:
-            formatted_result = f"{result['number']}. Title: {result.get('title', 'N/A')}\n"
-            formatted_result += f"   Snippet: {result.get('body', 'N/A')[:200]}...\n"
-            formatted_result += f"   URL: {result.get('href', 'N/A')}\n"
-            formatted_results.append(formatted_result)
-        return "\n".join(formatted_results)
+    def content_covers_query(self, user_query: str, scraped_content: Dict[str, str]) -> bool:
+        query_words = set(WORD_RE.findall(user_query.lower())) - STOPWORDS
+        if not query_words:
+            return False
+        content = ' '.join(scraped_content.values()).lower()
+        if len(content) < EARLY_ANSWER_MIN_FILL * MAX_CONTENT_CHARS * len(scraped_content):
+            return False
+        covered = len(query_words & set(WORD_RE.findall(content)))
+        return covered / len(query_words) >= EARLY_ANSWER_MIN_COVERAGE
+
+    def rank_results(self, results: List[Dict], user_query: str) -> List[Dict]:
+        # Order results by how many query keywords their title and snippet share; ties keep DuckDuckGo's order
+        query_words = set(WORD_RE.findall(user_query.lower())) - STOPWORDS
+        def score(result):
+            result_words = set(WORD_RE.findall(f"{result.get('title', '')} {result.get('body', '')}".lower()))
+            return len(query_words & result_words)
+        return sorted(results, key=score, reverse=True)
+
+    def format_results(self, results: List[Dict], max_chars_per_snippet: int = 200) -> str:
+        return "\n".join(
+            f"{result['number']}. Title: {result.get('title', 'N/A')}\n"
+            f"   Snippet: {self.format_snippet(result.get('body', 'N/A'), max_chars_per_snippet)}\n"
+            f"   URL: {result.get('href', 'N/A')}\n"
+            for result in results
+        )
+
+    def format_snippet(self, body: str, max_chars: int = 200) -> str:
+        return body[:max_chars] + "..." if len(body) > max_chars else body
 
     def scrape_content(self, urls: List[str]) -> Dict[str, str]:
+        return asyncio.run(self.scrape_content_async(urls))
+
+    @staticmethod
+    def scrape_allowed_url(url: str) -> Union[Dict[str, str], None]:
+        if not can_fetch(url):
+            return None
+        return get_web_content([url])
+
+    async def scrape_url(self, url: str, executor: ThreadPoolExecutor = None) -> Union[Dict[str, str], None]:
+        # Only pages robots.txt allowed are cached, so a hit skips both the robots check and the fetch
+        content = self.cache.get('page', url)
+        if content is not None:
+            logger.info(f"Content for {url} served from cache")
+            return content
+        # robots.txt and page fetches are blocking, so each URL runs on its own worker thread
+        try:
+            content = await asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(executor, self.scrape_allowed_url, url), timeout=SCRAPE_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timed out scraping {url}")
+            content = {}
+        if content:
+            self.cache.set('page', url, content, expire=PAGE_CACHE_TTL)
+        return content
+
+    async def scrape_content_async(self, urls: List[str]) -> Dict[str, str]:
         scraped_content = {}
         blocked_urls = []
-        for url in urls:
-            robots_allowed = can_fetch(url)
-            if robots_allowed:
-                content = get_web_content([url])
-                if content:
-                    scraped_content.update(content)
-                    print(Fore.YELLOW + f"Successfully scraped: {url}" + Style.RESET_ALL)
-                    logger.info(f"Successfully scraped: {url}")
-                else:
-                    print(Fore.RED + f"Robots.txt disallows scraping of {url}" + Style.RESET_ALL)
-                    logger.warning(f"Robots.txt disallows scraping of {url}")
-            else:
+        # A dedicated executor that is not waited for, so a timed-out scrape can't hold up asyncio.run's shutdown
+        executor = ThreadPoolExecutor(max_workers=max(1, len(urls)))
+        try:
+            results = await asyncio.gather(*(self.scrape_url(url, executor) for url in urls), return_exceptions=True)
+        finally:
+            executor.shutdown(wait=False)
+        for url, content in zip(urls, results):
+            if isinstance(content, Exception):
+                cprint(f"Failed to scrape {url}", Fore.RED)
+                logger.error(f"Error scraping {url}: {str(content)}")
+                continue
+            if content is None:
                 blocked_urls.append(url)
-                print(Fore.RED + f"Warning: Robots.txt disallows scraping of {url}" + Style.RESET_ALL)
+                cprint(f"Warning: Robots.txt disallows scraping of {url}", Fore.RED)
+                logger.warning(f"Robots.txt disallows scraping of {url}")
+            elif content:
+                scraped_content.update(content)
+                cprint(f"Successfully scraped: {url}", Fore.YELLOW)
+                logger.info(f"Successfully scraped: {url}")
+            else:
+                cprint(f"Robots.txt disallows scraping of {url}", Fore.RED)
                 logger.warning(f"Robots.txt disallows scraping of {url}")
 
-        print(Fore.CYAN + f"Scraped content received for {len(scraped_content)} URLs" + Style.RESET_ALL)
+        cprint(f"Scraped content received for {len(scraped_content)} URLs", Fore.CYAN)
         logger.info(f"Scraped content received for {len(scraped_content)} URLs")
 
         if blocked_urls:
-            print(Fore.RED + f"Warning: {len(blocked_urls)} URL(s) were not scraped due to robots.txt restrictions." + Style.RESET_ALL)
+            cprint(f"Warning: {len(blocked_urls)} URL(s) were not scraped due to robots.txt restrictions.", Fore.RED)
             logger.warning(f"{len(blocked_urls)} URL(s) were not scraped due to robots.txt restrictions: {', '.join(blocked_urls)}")
 
         return scraped_content
 
     def display_scraped_content(self, scraped_content: Dict[str, str]):
-        print(f"\n{Fore.CYAN}Scraped Content:{Style.RESET_ALL}")
+        if not self.verbose:
+            logger.debug(f"Scraped content from: {', '.join(scraped_content)}")
+            return
+        cprint("\nScraped Content:", Fore.CYAN)
         for url, content in scraped_content.items():
-            print(f"{Fore.GREEN}URL: {url}{Style.RESET_ALL}")
+            cprint(f"URL: {url}", Fore.GREEN)
             print(f"Content: {content[:4000]}...\n")
 
     def generate_final_answer(self, user_query: str, scraped_content: Dict[str, str]) -> str:
         user_query_short = user_query[:200]
-        prompt = f"""
-You are an AI assistant. Provide a comprehensive and detailed answer to the following question using ONLY the information provided in the scraped content. Do not include any references or mention any sources. Answer directly and thoroughly.
-
+        prompt = self.fit_to_context(lambda content: FINAL_ANSWER_PROMPT_PREFIX + f"""
 Question: "{user_query_short}"
 
 Scraped Content:
-{self.format_scraped_content(scraped_content)}
-
-Important Instructions:
-1. Do not use phrases like "Based on the absence of selected results" or similar.
-2. If the scraped content does not contain enough information to answer the question, say so explicitly and explain what information is missing.
-3. Provide as much relevant detail as possible from the scraped content.
+{self.format_scraped_content(content)}
 
 Answer:
-"""
+""", scraped_content, max_tokens=1024)
         max_retries = 3
         for attempt in range(max_retries):
-            with OutputRedirector() as output:
-                response_text = self.llm.generate(prompt, max_tokens=1024, stop=None)
-            llm_output = output.getvalue()
-            logger.info(f"LLM Output in generate_final_answer:\n{llm_output}")
+            response_text = self.cached_generate(prompt, generate=self.stream_answer, max_tokens=1024, stop=STOP_SEQUENCES, **self.retry_kwargs(attempt))
             if response_text:
                 logger.info(f"LLM Response:\n{response_text}")
                 return response_text
 
-        error_message = "I apologize, but I couldn't generate a satisfactory answer based on the available information."
         logger.warning(f"Failed to generate a response after {max_retries} attempts. Returning error message.")
-        return error_message
+        return FINAL_ANSWER_ERROR_MESSAGE
+
+    def fit_to_context(self, build_prompt, scraped_content: Dict[str, str], max_tokens: int) -> str:
+        # Drop the last-selected pages, then shorten the remaining one, until the prompt and answer fit n_ctx
+        prompt = build_prompt(scraped_content)
+        budget = self.llm.context_size() - max_tokens - CONTEXT_RESERVE_TOKENS
+        prompt_tokens = self.llm.count_tokens(prompt)
+        initial_tokens = prompt_tokens
+        while prompt_tokens > budget and scraped_content:
+            scraped_content = dict(scraped_content)
+            if len(scraped_content) > 1:
+                scraped_content.popitem()
+            else:
+                url, content = next(iter(scraped_content.items()))
+                if not content:
+                    break
+                scraped_content[url] = content[:int(len(content) * budget / prompt_tokens * 0.9)]
+            prompt = build_prompt(scraped_content)
+            prompt_tokens = self.llm.count_tokens(prompt)
+        if prompt_tokens != initial_tokens:
+            logger.info(f"Trimmed scraped content from {initial_tokens} to {prompt_tokens} prompt tokens to fit the context")
+        return prompt
+
+    def stream_answer(self, prompt: str, **kwargs) -> str:
+        # Print tokens as they arrive so the answer starts appearing right away
+        chunks = []
+        for chunk in self.llm.generate_stream(prompt, **kwargs):
+            if not chunks:
+                cprint("\n🤖 Assistant:", Fore.GREEN)
+            chunks.append(chunk)
+            print(chunk, end='', flush=True)
+        if chunks:
+            print()
+            self.answer_streamed = True
+        return ''.join(chunks).strip()
 
     def format_scraped_content(self, scraped_content: Dict[str, str]) -> str:
         formatted_content = []
+        remaining_chars = self.max_content_chars
         for url, content in scraped_content.items():
-            content = re.sub(r'\s+', ' ', content)
+            if remaining_chars <= 0:
+                break
+            # str.split collapses whitespace runs faster than a regex on large pages
+            content = ' '.join(content.split())
+            if len(content) > remaining_chars:
+                # Tell the model the page goes on, so it doesn't treat a cut-off sentence as the whole story
+                content = content[:remaining_chars] + " [truncated]"
+                remaining_chars = 0
+            else:
+                remaining_chars -= len(content)
             formatted_content.append(f"Content from {url}:\n{content}\n")
         return "\n".join(formatted_content)
 
     def synthesize_final_answer(self, user_query: str) -> str:
-        prompt = f"""
-After multiple search attempts, we couldn't find a fully satisfactory answer to the user's question: "{user_query}"
-
-Please provide the best possible answer you can, acknowledging any limitations or uncertainties.
-If appropriate, suggest ways the user might refine their question or where they might find more information.
-
-Respond in a clear, concise, and informative manner.
+        prompt = SYNTHESIZE_PROMPT_PREFIX + f"""
+User's question: "{user_query}"
 """
         try:
-            with OutputRedirector() as output:
-                response_text = self.llm.generate(prompt, max_tokens=self.llm_config.get('max_tokens', 1024), stop=self.llm_config.get('stop', None))
-            llm_output = output.getvalue()
-            logger.info(f"LLM Output in synthesize_final_answer:\n{llm_output}")
+            response_text = self.cached_generate(prompt, max_tokens=self.llm_config.get('max_tokens', 1024), stop=self.llm_config.get('stop', None))
+            logger.info(f"LLM Output in synthesize_final_answer:\n{response_text}")
             if response_text:
                 return response_text.strip()
         except Exception as e:
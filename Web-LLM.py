@@ -1,12 +1,17 @@
-import sys
 import os
+import sys
 from colorama import init, Fore, Style
 import logging
-from io import StringIO
 from Self_Improving_Search import EnhancedSelfImprovingSearch
 from llm_config import get_llm_config
 from llm_response_parser import UltimateLLMResponseParser
-from llm_wrapper import LLMWrapper
+from llm_wrapper import get_llm_wrapper
+
+try:
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.key_binding import KeyBindings
+except ImportError:
+    PromptSession = None
 
 # Initialize colorama for cross-platform color support
 if os.name == 'nt':  # Windows-specific initialization
@@ -14,31 +19,32 @@ if os.name == 'nt':  # Windows-specific initialization
 else:
     init()
 
-# Set up logging
-log_directory = 'logs'
-if not os.path.exists(log_directory):
-    os.makedirs(log_directory)
-
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-log_file = os.path.join(log_directory, 'web_llm.log')
-file_handler = logging.FileHandler(log_file)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
-logger.handlers = []
-logger.addHandler(file_handler)
-logger.propagate = False
-
-# Disable all other loggers to prevent console output
-for name in logging.root.manager.loggerDict:
-    if name != __name__:
-        logging.getLogger(name).disabled = True
-
-# Suppress root logger
-root_logger = logging.getLogger()
-root_logger.handlers = []
-root_logger.propagate = False
-root_logger.setLevel(logging.WARNING)
+
+def init_logging():
+    log_directory = 'logs'
+    if not os.path.exists(log_directory):
+        os.makedirs(log_directory)
+
+    logger.setLevel(logging.INFO)
+    log_file = os.path.join(log_directory, 'web_llm.log')
+    file_handler = logging.FileHandler(log_file)
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler.setFormatter(formatter)
+    logger.handlers = []
+    logger.addHandler(file_handler)
+    logger.propagate = False
+
+    # Disable all other loggers to prevent console output
+    for name in logging.root.manager.loggerDict:
+        if name != __name__:
+            logging.getLogger(name).disabled = True
+
+    # Suppress root logger
+    root_logger = logging.getLogger()
+    root_logger.handlers = []
+    root_logger.propagate = False
+    root_logger.setLevel(logging.WARNING)
 
 # Initialize the UltimateLLMResponseParser
 parser = UltimateLLMResponseParser()
@@ -51,21 +57,6 @@ ALWAYS follow the prompts provided throughout the searching process EXACTLY as i
 NEVER assume new instructions for anywhere other than directly when prompted directly. DO NOT SELF PROMPT OR PROVIDE MULTIPLE ANSWERS OR ATTEMPT MULTIPLE RESPONSES FOR ONE PROMPT!
 """
 
-class OutputRedirector:
-    def __init__(self, stream=None):
-        self.stream = stream or StringIO()
-        self.original_stdout = sys.stdout
-        self.original_stderr = sys.stderr
-
-    def __enter__(self):
-        sys.stdout = self.stream
-        sys.stderr = self.stream
-        return self.stream
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        sys.stdout = self.original_stdout
-        sys.stderr = self.original_stderr
-
 def print_header():
     print(Fore.CYAN + Style.BRIGHT + """
     ╔══════════════════════════════════════════════════════════╗
@@ -88,6 +79,19 @@ def print_header():
 def get_multiline_input():
     submit_key = "CTRL+Z" if os.name == 'nt' else "CTRL+D"
     print(Fore.GREEN + f"📝 Enter your message (Press {submit_key} to submit):" + Style.RESET_ALL)
+    if PromptSession is not None and sys.stdin.isatty():
+        # prompt_toolkit handles line editing, pastes and arrow keys; Enter adds a line, the submit key sends
+        key_bindings = KeyBindings()
+
+        @key_bindings.add('c-z' if os.name == 'nt' else 'c-d')
+        def submit(event):
+            event.current_buffer.validate_and_handle()
+
+        try:
+            return PromptSession(multiline=True, key_bindings=key_bindings).prompt()
+        except (KeyboardInterrupt, EOFError):
+            print("\nInput cancelled")
+            return ""
     lines = []
     while True:
         try:
@@ -106,10 +110,7 @@ def print_thinking():
 def initialize_llm():
     try:
         print(Fore.YELLOW + "Initializing LLM..." + Style.RESET_ALL)
-        with OutputRedirector() as output:
-            llm_wrapper = LLMWrapper()
-        initialization_output = output.getvalue()
-        logger.info(f"LLM Initialization Output:\n{initialization_output}")
+        llm_wrapper = get_llm_wrapper()
         print(Fore.GREEN + "LLM initialized successfully." + Style.RESET_ALL)
         return llm_wrapper
     except Exception as e:
@@ -129,14 +130,21 @@ def get_llm_response(llm, prompt):
             'top_k': llm_config.get('top_k', 0),
             'repeat_penalty': llm_config.get('repeat_penalty', 1.0),
         }
-        with OutputRedirector() as output:
-            response_text = llm.generate(full_prompt, **generate_kwargs)
-        llm_output = output.getvalue()
-        logger.info(f"LLM Output in get_llm_response:\n{llm_output}")
+        # Print tokens as they are generated instead of waiting for the whole completion
+        print(Fore.GREEN + "\n🤖 Assistant:" + Style.RESET_ALL)
+        chunks = []
+        for chunk in llm.generate_stream(full_prompt, **generate_kwargs):
+            chunks.append(chunk)
+            sys.stdout.write(chunk)
+            sys.stdout.flush()
+        print()
+        response_text = "".join(chunks)
+        logger.info(f"LLM Output in get_llm_response:\n{response_text}")
         return response_text
     except Exception as e:
         logger.error(f"Error getting LLM response: {str(e)}", exc_info=True)
-        return f"Sorry, I encountered an error while processing your request. Please check the log file for details."
+        print(f"\nSorry, I encountered an error while processing your request. Please check the log file for details.")
+        return None
 
 def print_assistant_response(response):
     print(Fore.GREEN + "\n🤖 Assistant:" + Style.RESET_ALL)
@@ -151,8 +159,10 @@ def print_footer():
     """ + Style.RESET_ALL)
 
 def main():
+    init_logging()
     print_header()
     llm = None
+    search = None
 
     while True:
         user_input = get_multiline_input()
@@ -169,19 +179,23 @@ def main():
         if user_input.startswith('/'):
             search_query = user_input[1:].strip()
             print(Fore.CYAN + "Initiating web search..." + Style.RESET_ALL)
-            search = EnhancedSelfImprovingSearch(llm=llm, parser=parser)
+            if search is None:
+                search = EnhancedSelfImprovingSearch(llm=llm, parser=parser)
             try:
                 answer = search.search_and_improve(search_query)
-                print_assistant_response(answer)
+                if not search.answer_streamed:
+                    print_assistant_response(answer)
             except Exception as e:
                 logger.error(f"Error during web search: {str(e)}", exc_info=True)
                 print_assistant_response(f"I encountered an error while performing the web search. Please check the log file for details.")
         else:
             print_thinking()
-            llm_response = get_llm_response(llm, user_input)
-            print_assistant_response(llm_response)
+            get_llm_response(llm, user_input)
 
         print_footer()
 
+    if search is not None:
+        search.close()
+
 if __name__ == "__main__":
     main()
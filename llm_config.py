@@ -3,20 +3,27 @@
 LLM_TYPE = "ollama"  # Options: 'llama_cpp', 'ollama'
 
 # LLM settings for llama_cpp
-MODEL_PATH = "/filepath/to/your/llama.cpp/model" # Replace with your llama.cpp models filepath
+MODEL_PATH = "/filepath/to/your/llama.cpp/model" # Replace with your llama.cpp models filepath (a Q4_K_M GGUF is a good speed/quality trade-off)
 
 LLM_CONFIG_LLAMA_CPP = {
     "llm_type": "llama_cpp",
     "model_path": MODEL_PATH,
     "n_ctx": 20000,  # context size
-    "n_gpu_layers": 0,  # number of layers to offload to GPU (-1 for all, 0 for none)
-    "n_threads": 8,  # number of threads to use
+    "n_gpu_layers": None,  # number of layers to offload to GPU (-1 for all, 0 for none, None for all when a GPU build is available)
+    "n_threads": None,  # number of threads to use (None for all CPU cores)
+    "n_batch": 512,  # prompt tokens processed per batch
+    "use_mmap": True,  # memory-map the model file instead of reading it into RAM
+    "use_mlock": False,  # lock the model in RAM so it is never swapped out
+    "offload_kqv": True,  # keep the KV cache on the GPU along with the offloaded layers
+    "flash_attn": True,  # use flash attention where the backend supports it
+    "warmup": True,  # run a one-token generation at startup so the first search doesn't pay for it
     "temperature": 0.7,  # temperature for sampling
     "top_p": 0.9,  # top p for sampling
     "top_k": 40,  # top k for sampling
     "repeat_penalty": 1.1,  # repeat penalty
     "max_tokens": 1024,  # max tokens to generate
-    "stop": ["User:", "\n\n"]  # stop sequences
+    "stop": ["User:", "\n\n"],  # stop sequences
+    "prompt_cache_bytes": 512 * 1024 * 1024  # RAM for cached prompt prefixes (0 to disable)
 }
 
 # LLM settings for Ollama
@@ -27,7 +34,10 @@ LLM_CONFIG_OLLAMA = {
     "temperature": 0.7,
     "top_p": 0.9,
     "n_ctx": 20000,  # context size
-    "stop": ["User:", "\n\n"]
+    "stop": ["User:", "\n\n"],
+    "keep_alive": "1h",  # how long Ollama keeps the model (and its prompt cache) loaded after a request
+    "request_timeout": 300,  # seconds to wait for the next streamed chunk (covers model loading on the first request)
+    "query_batch_size": 2  # search queries formulated per batched request (Ollama serves them in parallel)
 }
 
 def get_llm_config():
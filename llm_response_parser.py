@@ -1,24 +1,67 @@
 import re
+from itertools import islice
 from typing import Dict, List, Union
 import logging
 import json
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
 logger = logging.getLogger(__name__)
 
+json_decoder = json.JSONDecoder()
+
+def find_json_object(text: str) -> Union[Dict, None]:
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end < start:
+        return None
+    # Fast path: the response is a single object, possibly wrapped in prose
+    try:
+        parsed = json_loads(text[start:end + 1])
+        if isinstance(parsed, dict):
+            return parsed
+    except ValueError:
+        pass
+    # Otherwise decode the first complete object from each '{', ignoring whatever follows it
+    while start != -1:
+        try:
+            parsed, _ = json_decoder.raw_decode(text, start)
+            if isinstance(parsed, dict):
+                return parsed
+        except ValueError:
+            pass
+        start = text.find('{', start + 1)
+    return None
+
 class UltimateLLMResponseParser:
     def __init__(self):
         self.decision_keywords = {
             'refine': ['refine', 'need more info', 'insufficient', 'unclear', 'more research', 'additional search'],
             'answer': ['answer', 'sufficient', 'enough info', 'can respond', 'adequate', 'comprehensive']
         }
-        self.section_identifiers = [
-            ('decision', r'(?i)decision\s*:'),
-            ('reasoning', r'(?i)reasoning\s*:'),
-            ('selected_results', r'(?i)selected results\s*:'),
-            ('response', r'(?i)response\s*:')
+        # One alternation over every keyword so a decision is scored in a single pass over the text;
+        # longer keywords come first so "insufficient" is not also counted as "sufficient"
+        self.keyword_decisions = {keyword: decision for decision, keywords in self.decision_keywords.items() for keyword in keywords}
+        self.decision_pattern = re.compile('|'.join(re.escape(keyword) for keyword in sorted(self.keyword_decisions, key=len, reverse=True)))
+        section_patterns = [
+            ('decision', r'decision\s*:'),
+            ('reasoning', r'reasoning\s*:'),
+            ('selected_results', r'selected results\s*:'),
+            ('response', r'response\s*:')
         ]
+        self.section_identifiers = [(key, re.compile(pattern, re.IGNORECASE)) for key, pattern in section_patterns]
+        # A single pass over the response: each section runs until the next section header or the end
+        self.section_keys = [key for key, _ in section_patterns]
+        headers = "|".join(f'(?P<{key}>{pattern})' for key, pattern in section_patterns)
+        next_header = "|".join(pattern for _, pattern in section_patterns)
+        self.structured_pattern = re.compile(f'(?:{headers})(?P<value>.*?)(?={next_header}|$)', re.IGNORECASE | re.DOTALL)
+        self.number_pattern = re.compile(r'\b(?:10|[1-9])\b')
+        self.number_values = {str(i): i for i in range(1, 11)}
+        # Only this many selected results survive post-processing, so extraction stops there
+        self.max_selected_results = 2
+        self.key_value_pattern = re.compile(r'(.+?)[:.-](.+)')
 
     def parse_llm_response(self, response: str) -> Dict[str, Union[str, List[int]]]:
         logger.info("Starting to parse LLM response")
@@ -56,17 +99,17 @@ class UltimateLLMResponseParser:
             result = self._fallback_parsing(response)
 
         # Post-process the result
-        result = self._post_process_result(result)
+        result = self._post_process_result(result, response)
 
         logger.info("Finished parsing LLM response")
         return result
 
     def _parse_structured_response(self, response: str) -> Dict[str, Union[str, List[int]]]:
         result = {}
-        for key, pattern in self.section_identifiers:
-            match = re.search(f'{pattern}(.*?)(?={"|".join([p for k, p in self.section_identifiers if k != key])}|$)', response, re.IGNORECASE | re.DOTALL)
-            if match:
-                result[key] = match.group(1).strip()
+        for match in self.structured_pattern.finditer(response):
+            key = next(k for k in self.section_keys if match.group(k))
+            if key not in result:
+                result[key] = match.group('value').strip()
 
         if 'selected_results' in result:
             result['selected_results'] = self._extract_numbers(result['selected_results'])
@@ -74,30 +117,28 @@ class UltimateLLMResponseParser:
         return result
 
     def _parse_json_response(self, response: str) -> Dict[str, Union[str, List[int]]]:
-        try:
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                parsed_json = json.loads(json_str)
-                return {k: v for k, v in parsed_json.items() if k in ['decision', 'reasoning', 'selected_results', 'response']}
-        except json.JSONDecodeError:
-            pass
+        parsed_json = find_json_object(response)
+        if parsed_json:
+            return {k: v for k, v in parsed_json.items() if k in ['decision', 'reasoning', 'selected_results', 'response']}
         return {}
 
     def _parse_unstructured_response(self, response: str) -> Dict[str, Union[str, List[int]]]:
-        result = {}
+        # Section lines are collected and joined once instead of growing a string per line
+        sections = {}
         lines = response.split('\n')
         current_section = None
 
         for line in lines:
-            section_match = re.match(r'(.+?)[:.-](.+)', line)
+            section_match = self.key_value_pattern.match(line)
             if section_match:
                 key = self._match_section_to_key(section_match.group(1))
                 if key:
                     current_section = key
-                    result[key] = section_match.group(2).strip()
+                    sections[key] = [section_match.group(2).strip()]
             elif current_section:
-                result[current_section] += ' ' + line.strip()
+                sections[current_section].append(line.strip())
+
+        result = {key: ' '.join(parts) for key, parts in sections.items()}
 
         if 'selected_results' in result:
             result['selected_results'] = self._extract_numbers(result['selected_results'])
@@ -129,14 +170,15 @@ class UltimateLLMResponseParser:
         }
         return result
 
-    def _post_process_result(self, result: Dict[str, Union[str, List[int]]]) -> Dict[str, Union[str, List[int]]]:
+    def _post_process_result(self, result: Dict[str, Union[str, List[int]]], response: str) -> Dict[str, Union[str, List[int]]]:
+        # Infer from the raw response; the repr of result contains key names like 'response' that skew the keyword score
         if result['decision'] not in ['refine', 'answer']:
-            result['decision'] = self._infer_decision(str(result))
+            result['decision'] = self._infer_decision(response)
 
         if not isinstance(result['selected_results'], list):
             result['selected_results'] = self._extract_numbers(str(result['selected_results']))
 
-        result['selected_results'] = result['selected_results'][:2]
+        result['selected_results'] = result['selected_results'][:self.max_selected_results]
 
         if not result['reasoning']:
             result['reasoning'] = f"Based on the {'presence' if result['selected_results'] else 'absence'} of selected results and the overall content."
@@ -148,17 +190,19 @@ class UltimateLLMResponseParser:
 
     def _match_section_to_key(self, section: str) -> Union[str, None]:
         for key, pattern in self.section_identifiers:
-            if re.search(pattern, section, re.IGNORECASE):
+            if pattern.search(section):
                 return key
         return None
 
     def _extract_numbers(self, text: str) -> List[int]:
-        return [int(num) for num in re.findall(r'\b(?:10|[1-9])\b', text)]
+        matches = islice(self.number_pattern.finditer(text), self.max_selected_results)
+        return [self.number_values[match.group(0)] for match in matches]
 
     def _infer_decision(self, text: str) -> str:
-        text = text.lower()
-        refine_score = sum(text.count(keyword) for keyword in self.decision_keywords['refine'])
-        answer_score = sum(text.count(keyword) for keyword in self.decision_keywords['answer'])
+        scores = {'refine': 0, 'answer': 0}
+        for match in self.decision_pattern.finditer(text.lower()):
+            scores[self.keyword_decisions[match.group(0)]] += 1
+        refine_score, answer_score = scores['refine'], scores['answer']
         return 'refine' if refine_score > answer_score else 'answer'
 
     def _is_valid_result(self, result: Dict[str, Union[str, List[int]]]) -> bool:
@@ -166,6 +210,7 @@ class UltimateLLMResponseParser:
 
 # Example usage
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     parser = UltimateLLMResponseParser()
     test_response = """
     Decision: answer
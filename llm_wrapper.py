@@ -1,56 +1,157 @@
-from llama_cpp import Llama
+import os
+import ctypes
+import logging
+from llama_cpp import Llama, LlamaGrammar, LlamaRAMCache, llama_supports_gpu_offload, llama_log_set, llama_log_callback
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from llm_config import get_llm_config
 
+# orjson decodes the streamed NDJSON lines several times faster; the standard library is the fallback
+try:
+    from orjson import loads as json_loads, dumps as json_dumps
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+logger = logging.getLogger(__name__)
+
+# Routes llama.cpp's native log output to the logger instead of the console;
+# kept at module level so the ctypes callback is never garbage collected
+@llama_log_callback
+def llama_log_to_logger(level, text, user_data):
+    logger.debug(text.decode('utf-8', errors='replace').rstrip())
+
 class LLMWrapper:
     def __init__(self):
         self.llm_config = get_llm_config()
         self.llm_type = self.llm_config.get('llm_type', 'llama_cpp')
+        # Only llama.cpp honors the GBNF grammars passed to generate
+        self.supports_grammar = self.llm_type == 'llama_cpp'
+        self.grammars = {}
+        # llama_cpp.Llama is not thread-safe; calls from worker threads are serialized
+        self.lock = threading.Lock()
         if self.llm_type == 'llama_cpp':
             self.llm = self._initialize_llama_cpp()
         elif self.llm_type == 'ollama':
             self.base_url = self.llm_config.get('base_url', 'http://localhost:11434')
             self.model_name = self.llm_config.get('model_name', 'your_model_name')
+            # One pooled keep-alive session for all requests, sized for the concurrent generate_batch calls
+            self.session = requests.Session()
+            self.session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(total=2, backoff_factor=0.1)))
+            self.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(total=2, backoff_factor=0.1)))
         else:
             raise ValueError(f"Unsupported LLM type: {self.llm_type}")
 
     def _initialize_llama_cpp(self):
-        return Llama(
+        llama_log_set(llama_log_to_logger, ctypes.c_void_p(0))
+        n_gpu_layers = self.llm_config.get('n_gpu_layers')
+        if os.environ.get('LLM_N_GPU_LAYERS'):
+            n_gpu_layers = int(os.environ['LLM_N_GPU_LAYERS'])
+        if n_gpu_layers is None:
+            n_gpu_layers = -1 if llama_supports_gpu_offload() else 0
+        llm = Llama(
             model_path=self.llm_config.get('model_path'),
             n_ctx=self.llm_config.get('n_ctx', 2048),
-            n_gpu_layers=self.llm_config.get('n_gpu_layers', 0),
-            n_threads=self.llm_config.get('n_threads', 8),
+            n_gpu_layers=n_gpu_layers,
+            n_threads=self.llm_config.get('n_threads') or os.cpu_count(),
+            n_batch=self.llm_config.get('n_batch', 512),
+            use_mmap=self.llm_config.get('use_mmap', True),
+            use_mlock=self.llm_config.get('use_mlock', False),
+            offload_kqv=self.llm_config.get('offload_kqv', True),
+            flash_attn=self.llm_config.get('flash_attn', False),
             verbose=False
         )
+        if self.llm_config.get('warmup', False):
+            # Pay for weight loading and backend initialization now rather than on the first query
+            llm(" ", max_tokens=1)
+        # Keep KV states of recent prompts so shared prompt prefixes skip prefill
+        cache_capacity = self.llm_config.get('prompt_cache_bytes', 0)
+        if cache_capacity:
+            llm.set_cache(LlamaRAMCache(capacity_bytes=cache_capacity))
+        return llm
 
     def generate(self, prompt, **kwargs):
         if self.llm_type == 'llama_cpp':
             llama_kwargs = self._prepare_llama_kwargs(kwargs)
-            response = self.llm(prompt, **llama_kwargs)
+            with self.lock:
+                response = self.llm(prompt, **llama_kwargs)
             return response['choices'][0]['text'].strip()
         elif self.llm_type == 'ollama':
             return self._ollama_generate(prompt, **kwargs)
         else:
             raise ValueError(f"Unsupported LLM type: {self.llm_type}")
 
+    def generate_stream(self, prompt, **kwargs):
+        if self.llm_type == 'llama_cpp':
+            llama_kwargs = self._prepare_llama_kwargs(kwargs)
+            with self.lock:
+                for chunk in self.llm(prompt, stream=True, **llama_kwargs):
+                    yield chunk['choices'][0]['text']
+        elif self.llm_type == 'ollama':
+            yield from self._ollama_stream(prompt, **kwargs)
+        else:
+            raise ValueError(f"Unsupported LLM type: {self.llm_type}")
+
+    def context_size(self):
+        if self.llm_type == 'llama_cpp':
+            return self.llm.n_ctx()
+        return self.llm_config.get('n_ctx', 2048)
+
+    def count_tokens(self, text):
+        if self.llm_type == 'llama_cpp':
+            return len(self.llm.tokenize(text.encode('utf-8')))
+        # Ollama's API has no tokenize endpoint, so estimate at roughly four characters per token
+        return len(text) // 4
+
+    def generate_batch(self, prompts, **kwargs):
+        if not prompts:
+            return []
+        if self.llm_type == 'ollama':
+            # The Ollama server batches concurrent requests into parallel slots
+            with ThreadPoolExecutor(max_workers=len(prompts)) as executor:
+                return list(executor.map(lambda prompt: self._ollama_generate(prompt, **kwargs), prompts))
+        # llama_cpp.Llama holds a single sequence, so prompts are evaluated one after another
+        return [self.generate(prompt, **kwargs) for prompt in prompts]
+
     def _ollama_generate(self, prompt, **kwargs):
+        return ''.join(self._ollama_stream(prompt, **kwargs)).strip()
+
+    def _ollama_stream(self, prompt, **kwargs):
         url = f"{self.base_url}/api/generate"
         data = {
             'model': self.model_name,
             'prompt': prompt,
+            'keep_alive': self.llm_config.get('keep_alive', '1h'),
             'options': {
                 'temperature': kwargs.get('temperature', self.llm_config.get('temperature', 0.7)),
                 'top_p': kwargs.get('top_p', self.llm_config.get('top_p', 0.9)),
                 'stop': kwargs.get('stop', self.llm_config.get('stop', [])),
                 'num_predict': kwargs.get('max_tokens', self.llm_config.get('max_tokens', 1024)),
+                # Sent on every request: a changed num_ctx makes Ollama reload the model and drop its prompt cache
+                'num_ctx': self.llm_config.get('n_ctx', 2048),
             }
         }
-        response = requests.post(url, json=data, stream=True)
-        if response.status_code != 200:
-            raise Exception(f"Ollama API request failed with status {response.status_code}: {response.text}")
-        text = ''.join(json.loads(line)['response'] for line in response.iter_lines() if line)
-        return text.strip()
+        if 'seed' in kwargs:
+            data['options']['seed'] = kwargs['seed']
+        # Ollama has no grammars, but its JSON mode guarantees a parseable object
+        if kwargs.get('json_format'):
+            data['format'] = 'json'
+        timeout = (3, self.llm_config.get('request_timeout', 300))
+        response = self.session.post(url, data=json_dumps(data), headers={'Content-Type': 'application/json'}, stream=True, timeout=timeout)
+        # Closing the response when the caller stops early makes Ollama abort the generation
+        with response:
+            if response.status_code != 200:
+                raise Exception(f"Ollama API request failed with status {response.status_code}: {response.text}")
+            for line in response.iter_lines():
+                if line:
+                    yield json_loads(line)['response']
 
     def _prepare_llama_kwargs(self, kwargs):
         llama_kwargs = {
@@ -60,4 +161,23 @@ class LLMWrapper:
             'stop': kwargs.get('stop', self.llm_config.get('stop', [])),
             'echo': False,
         }
+        if 'seed' in kwargs:
+            llama_kwargs['seed'] = kwargs['seed']
+        # GBNF grammars constrain llama.cpp sampling; the Ollama API has no equivalent, so they only apply here
+        grammar = kwargs.get('grammar')
+        if grammar:
+            llama_kwargs['grammar'] = self._get_grammar(grammar)
         return llama_kwargs
+
+    def _get_grammar(self, grammar):
+        if grammar not in self.grammars:
+            self.grammars[grammar] = LlamaGrammar.from_string(grammar, verbose=False)
+        return self.grammars[grammar]
+
+@lru_cache(maxsize=1)
+def load_llm_wrapper(config_key):
+    return LLMWrapper()
+
+def get_llm_wrapper():
+    # Loading a llama.cpp model takes seconds, so the wrapper is built once per configuration and shared
+    return load_llm_wrapper(json.dumps(get_llm_config(), sort_keys=True))
@@ -0,0 +1,51 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+class ResponseCache:
+    def __init__(self, path=os.path.join('cache', 'responses.sqlite')):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache (namespace TEXT, key TEXT, value TEXT, expires_at REAL, PRIMARY KEY (namespace, key))"
+        )
+        # Expired rows are skipped by get, so drop them at startup to keep the file from growing without bound
+        self.connection.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        self.connection.commit()
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.blake2b("|".join(str(part) for part in parts).encode()).hexdigest()
+
+    def get(self, namespace, key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < time.time():
+                self.connection.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+                self.connection.commit()
+                return None
+        return json.loads(value)
+
+    def set(self, namespace, key, value, expire=None):
+        expires_at = time.time() + expire if expire else None
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), expires_at)
+            )
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
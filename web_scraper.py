@@ -1,109 +1,299 @@
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, UnicodeDammit
 from urllib.robotparser import RobotFileParser
-from urllib.parse import urlparse, urljoin
+from urllib.parse import urlparse, urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
 import time
 import logging
+import importlib.util
+import threading
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import re
+from functools import lru_cache
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# lxml builds the tree in C and is much faster than the pure-Python html.parser
+HTML_PARSER = 'lxml' if importlib.util.find_spec('lxml') is not None else 'html.parser'
+
+# selectolax (a C HTML5 parser with CSS selectors) is faster still; BeautifulSoup is used when it is missing
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    HTMLParser = None
+
+MAX_CONTENT_CHARS = 2400
+MAX_PAGE_BYTES = 2_000_000
+PAGE_CACHE_SIZE = 256
+# How long scraped page content stays fresh (seconds), in memory and on disk
+PAGE_CACHE_TTL = 6 * 3600
+MAX_ROBOTS_BYTES = 512 * 1024  # robots.txt content past 500 KiB is ignored by major crawlers too
+MAX_LINKS = 10
+MAX_TRACKED_DOMAINS = 4096
+STRIP_TAGS = ["script", "style", "nav", "footer", "header"]
+# Candidates for the element holding the main content, in order of preference
+MAIN_CONTENT_TAGS = ['main', 'article', 'div']
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def canonical_url(url):
+    # Lowercase scheme and host, drop default ports and fragments, and sort the query so equivalent URLs compare equal
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    try:
+        if parts.port is not None and parts.port == DEFAULT_PORTS.get(scheme):
+            netloc = netloc.rsplit(':', 1)[0]
+    except ValueError:
+        pass
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+def read_capped(response, limit):
+    # Reads a streamed response body, stopping once limit bytes have arrived
+    chunks = []
+    total = 0
+    for chunk in response.iter_content(65536):
+        chunks.append(chunk)
+        total += len(chunk)
+        if total >= limit:
+            break
+    return b''.join(chunks)[:limit]
+
+def collect_text(strings, limit):
+    # Stops once limit characters are gathered instead of joining the whole page and slicing
+    parts = []
+    total = 0
+    for string in strings:
+        string = ' '.join(string.split())
+        if string:
+            parts.append(string)
+            total += len(string) + 1
+            if total >= limit:
+                break
+    return ' '.join(parts)[:limit]
+
+MAX_RETRY_AFTER = 5  # seconds; longer Retry-After requests are not worth holding a search for
+
+class CappedRetry(Retry):
+    # Honors Retry-After, but never sleeps longer than MAX_RETRY_AFTER for it
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, MAX_RETRY_AFTER)
+
 class WebScraper:
     def __init__(self, user_agent="WebLLMAssistant/1.0 (+https://github.com/YourUsername/Web-LLM-Assistant-Llama-cpp)",
-                 rate_limit=1, timeout=10, max_retries=3):
+                 rate_limit=1, timeout=10, max_retries=3, max_workers=32, max_connections_per_host=2):
         self.session = requests.Session()
         self.session.headers.update({"User-Agent": user_agent})
-        self.robot_parser = RobotFileParser()
+        # Keep connections to recently scraped hosts alive, and retry failed requests inside urllib3
+        retry = CappedRetry(total=max_retries, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=frozenset(['GET', 'HEAD']), respect_retry_after_header=True,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # robots.txt is fetched once per host without retries, so an unhealthy host can't stall page selection
+        self.robots_session = requests.Session()
+        self.robots_session.headers.update({"User-Agent": user_agent})
+        robots_adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=0)
+        self.robots_session.mount('http://', robots_adapter)
+        self.robots_session.mount('https://', robots_adapter)
         self.rate_limit = rate_limit
         self.timeout = timeout
         self.max_retries = max_retries
-        self.last_request_time = {}
+        self.last_request_time = OrderedDict()
+        self.rate_limit_lock = threading.Lock()
+        # Recently scraped pages (None for pages robots.txt disallows); shared by all scraping threads
+        self.page_cache = OrderedDict()
+        self.page_cache_lock = threading.Lock()
+        # Many pages are fetched at once, but only a few from any one host
+        self.max_connections_per_host = max_connections_per_host
+        self.host_semaphores = OrderedDict()
+        self.host_semaphores_lock = threading.Lock()
 
     def can_fetch(self, url):
-        parsed_url = urlparse(url)
-        robots_url = f"{parsed_url.scheme}://{parsed_url.netloc}/robots.txt"
-        self.robot_parser.set_url(robots_url)
-        try:
-            self.robot_parser.read()
-            return self.robot_parser.can_fetch(self.session.headers["User-Agent"], url)
-        except Exception as e:
-            logger.warning(f"Error reading robots.txt for {url}: {e}")
-            return True  # Assume allowed if robots.txt can't be read
+        return robots_allow(url, self.session.headers["User-Agent"])
 
     def respect_rate_limit(self, url):
         domain = urlparse(url).netloc
-        current_time = time.time()
-        if domain in self.last_request_time:
-            time_since_last_request = current_time - self.last_request_time[domain]
-            if time_since_last_request < self.rate_limit:
-                time.sleep(self.rate_limit - time_since_last_request)
-        self.last_request_time[domain] = time.time()
-
-    def scrape_page(self, url):
+        # Reserve the next slot for the domain under the lock, so concurrent requests to one host are spaced out
+        with self.rate_limit_lock:
+            current_time = time.monotonic()
+            request_time = current_time
+            if domain in self.last_request_time:
+                request_time = max(current_time, self.last_request_time[domain] + self.rate_limit)
+            self.last_request_time[domain] = request_time
+            self.last_request_time.move_to_end(domain)
+            if len(self.last_request_time) > MAX_TRACKED_DOMAINS:
+                self.last_request_time.popitem(last=False)
+        if request_time > current_time:
+            time.sleep(request_time - current_time)
+
+    def scrape_page(self, url, content_only=False):
+        key = (canonical_url(url), content_only)
+        with self.page_cache_lock:
+            if key in self.page_cache:
+                cached_at, page = self.page_cache[key]
+                if time.monotonic() - cached_at < PAGE_CACHE_TTL:
+                    self.page_cache.move_to_end(key)
+                    return page
+                del self.page_cache[key]
+
         if not self.can_fetch(url):
             logger.info(f"Robots.txt disallows scraping: {url}")
+            self.cache_page(key, None)
             return None
 
-        for attempt in range(self.max_retries):
-            try:
-                self.respect_rate_limit(url)
-                response = self.session.get(url, timeout=self.timeout)
+        with self.host_semaphore(url):
+            page = self.fetch_page(url, content_only)
+        # Failed fetches may be transient, so only successful scrapes are kept
+        if page is not None:
+            self.cache_page(key, page)
+        return page
+
+    def host_semaphore(self, url):
+        domain = urlparse(url).netloc
+        with self.host_semaphores_lock:
+            if domain not in self.host_semaphores:
+                self.host_semaphores[domain] = threading.BoundedSemaphore(self.max_connections_per_host)
+            self.host_semaphores.move_to_end(domain)
+            # Hosts in use were just moved to the end, so only long-idle ones are dropped
+            if len(self.host_semaphores) > MAX_TRACKED_DOMAINS:
+                self.host_semaphores.popitem(last=False)
+            return self.host_semaphores[domain]
+
+    def cache_page(self, key, page):
+        with self.page_cache_lock:
+            self.page_cache[key] = (time.monotonic(), page)
+            self.page_cache.move_to_end(key)
+            if len(self.page_cache) > PAGE_CACHE_SIZE:
+                self.page_cache.popitem(last=False)
+
+    def fetch_page(self, url, content_only=False):
+        try:
+            self.respect_rate_limit(url)
+            # Stream the body so non-HTML downloads are dropped unread and huge pages are cut off
+            with self.session.get(url, timeout=self.timeout, stream=True) as response:
                 response.raise_for_status()
-                return self.extract_content(response.text, url)
-            except requests.RequestException as e:
-                logger.warning(f"Error scraping {url} (attempt {attempt + 1}/{self.max_retries}): {e}")
-                if attempt == self.max_retries - 1:
-                    logger.error(f"Failed to scrape {url} after {self.max_retries} attempts")
+                content_type = response.headers.get('Content-Type', '').lower()
+                if content_type and 'html' not in content_type:
+                    logger.info(f"Skipping non-HTML content ({content_type}): {url}")
                     return None
-                time.sleep(2 ** attempt)  # Exponential backoff
+                html = read_capped(response, MAX_PAGE_BYTES)
+                # The parser decodes the bytes itself; a declared charset is passed as a hint, otherwise it reads <meta charset>
+                encoding = response.encoding if 'charset' in content_type else None
+            return self.extract_content(html, url, encoding, content_only)
+        except requests.RequestException as e:
+            logger.error(f"Failed to scrape {url} after {self.max_retries} retries: {e}")
+            return None
 
-    def extract_content(self, html, url):
-        soup = BeautifulSoup(html, 'html.parser')
+    def extract_content(self, html, url, encoding=None, content_only=False):
+        if HTMLParser is not None:
+            return self.extract_content_selectolax(html, url, encoding, content_only)
+
+        soup = BeautifulSoup(html, HTML_PARSER, from_encoding=encoding)
 
         # Remove unwanted elements
-        for element in soup(["script", "style", "nav", "footer", "header"]):
+        for element in soup(STRIP_TAGS):
             element.decompose()
 
-        # Extract title
-        title = soup.title.string if soup.title else ""
-
-        # Try to find main content
-        main_content = soup.find('main') or soup.find('article') or soup.find('div', class_='content')
+        # Collect the title, main content candidates, paragraphs and links in a single walk of the tree
+        title = None
+        candidates = {}
+        all_paragraphs = []
+        links = []
+        # With content_only the caller wants just the text, so title and links are not collected
+        tags = ['p'] + MAIN_CONTENT_TAGS if content_only else ['title', 'p', 'a'] + MAIN_CONTENT_TAGS
+        for element in soup.find_all(tags):
+            name = element.name
+            if name == 'p':
+                all_paragraphs.append(element)
+            elif name == 'a':
+                if len(links) < MAX_LINKS and element.has_attr('href'):
+                    links.append(urljoin(url, element['href']))
+            elif name == 'title':
+                if title is None:
+                    title = element.string or ""
+            elif name not in candidates and (name != 'div' or 'content' in element.get('class', [])):
+                candidates[name] = element
 
-        if main_content:
-            paragraphs = main_content.find_all('p')
-        else:
-            paragraphs = soup.find_all('p')
+        # Prefer paragraphs from the main content, if the page marks one up
+        main_content = next((candidates[name] for name in MAIN_CONTENT_TAGS if name in candidates), None)
+        paragraphs = main_content.find_all('p') if main_content else all_paragraphs
 
-        # Extract text from paragraphs
-        text = ' '.join([p.get_text().strip() for p in paragraphs])
+        # Extract text from paragraphs, with whitespace collapsed
+        text = collect_text((p.get_text() for p in paragraphs), MAX_CONTENT_CHARS)
 
         # If no paragraphs found, get all text
         if not text:
-            text = soup.get_text()
+            text = collect_text(soup.stripped_strings, MAX_CONTENT_CHARS)
 
-        # Clean up whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
+        if content_only:
+            return text
 
-        # Extract and resolve links
-        links = [urljoin(url, a['href']) for a in soup.find_all('a', href=True)]
+        return {
+            "url": url,
+            "title": title or "",
+            "content": text,
+            "links": links
+        }
+
+    def extract_content_selectolax(self, html, url, encoding=None, content_only=False):
+        if isinstance(html, bytes):
+            # Lexbor always reads bytes as UTF-8, so decode first the way BeautifulSoup would:
+            # the HTTP charset, then <meta charset>, then sniffing
+            dammit = UnicodeDammit(html, [encoding] if encoding else [], is_html=True)
+            html = dammit.unicode_markup if dammit.unicode_markup is not None else html.decode('utf-8', errors='replace')
+        tree = HTMLParser(html)
+
+        # Remove unwanted elements
+        tree.strip_tags(STRIP_TAGS)
+
+        # Prefer paragraphs from the main content, if the page marks one up
+        main_content = tree.css_first('main') or tree.css_first('article') or tree.css_first('div.content')
+        root = tree.body or tree.root
+        paragraphs = (main_content or root).css('p')
+
+        # Extract text from paragraphs, with whitespace collapsed
+        text = collect_text((p.text() for p in paragraphs), MAX_CONTENT_CHARS)
+
+        # If no paragraphs found, get all text
+        if not text and root is not None:
+            text = collect_text([root.text(separator=' ')], MAX_CONTENT_CHARS)
+
+        if content_only:
+            return text
+
+        title_node = tree.css_first('title')
+        links = [urljoin(url, a.attributes['href']) for a in tree.css('a[href]')[:MAX_LINKS]]
 
         return {
             "url": url,
-            "title": title,
-            "content": text[:2400],  # Limit to first 2400 characters
-            "links": links[:10]  # Limit to first 10 links
+            "title": title_node.text() if title_node else "",
+            "content": text,
+            "links": links
         }
 
-def scrape_multiple_pages(urls, max_workers=5):
-    scraper = WebScraper()
+# One scraper per process, so its session keeps connections alive across searches
+@lru_cache(maxsize=1)
+def get_scraper():
+    return WebScraper()
+
+def scrape_multiple_pages(urls, max_workers=32, content_only=False):
+    scraper = get_scraper()
     results = {}
 
+    # Scrape each page once, even if it is listed under several equivalent URLs; results use the first spelling
+    unique_urls = {}
+    for url in urls:
+        unique_urls.setdefault(canonical_url(url), url)
+
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_url = {executor.submit(scraper.scrape_page, url): url for url in urls}
+        future_to_url = {executor.submit(scraper.scrape_page, url, content_only): url for url in unique_urls.values()}
         for future in as_completed(future_to_url):
             url = future_to_url[future]
             try:
@@ -120,23 +310,70 @@ def scrape_multiple_pages(urls, max_workers=5):
 
 # Function to integrate with your main system
 def get_web_content(urls):
-    scraped_data = scrape_multiple_pages(urls)
-    return {url: data['content'] for url, data in scraped_data.items() if data}
+    return scrape_multiple_pages(urls, content_only=True)
 
-# Standalone can_fetch function
-def can_fetch(url):
+# robots.txt is per host, so each host's file is fetched and parsed once and reused until it expires.
+# RFC 9309 asks crawlers not to keep a cached robots.txt for more than 24 hours.
+ROBOTS_CACHE_TTL = 24 * 3600
+ROBOTS_CACHE_SIZE = 1024
+robots_cache = OrderedDict()
+robots_cache_lock = threading.Lock()
+
+def get_robots_parser(scheme, netloc):
+    # Raises when robots.txt can't be fetched; failures are not cached so the next check tries again
+    key = (scheme, netloc)
+    with robots_cache_lock:
+        if key in robots_cache:
+            fetched_at, rp = robots_cache[key]
+            if time.monotonic() - fetched_at < ROBOTS_CACHE_TTL:
+                robots_cache.move_to_end(key)
+                return rp
+            del robots_cache[key]
+    rp = fetch_robots_parser(scheme, netloc)
+    with robots_cache_lock:
+        robots_cache[key] = (time.monotonic(), rp)
+        robots_cache.move_to_end(key)
+        if len(robots_cache) > ROBOTS_CACHE_SIZE:
+            robots_cache.popitem(last=False)
+    return rp
+
+# Downloaded over the scraper's keep-alive robots session (with a timeout) rather than RobotFileParser.read's urllib
+def fetch_robots_parser(scheme, netloc):
+    robots_url = f"{scheme}://{netloc}/robots.txt"
+    rp = RobotFileParser(robots_url)
+    scraper = get_scraper()
+    with scraper.robots_session.get(robots_url, timeout=scraper.timeout, stream=True) as response:
+        # Like RobotFileParser.read, 401/403 and server errors disallow the host (RFC 9309) and other 4xx allow it
+        if response.status_code in (401, 403) or response.status_code >= 500:
+            rp.disallow_all = True
+        elif 400 <= response.status_code < 500:
+            rp.allow_all = True
+        else:
+            response.raise_for_status()
+            body = read_capped(response, MAX_ROBOTS_BYTES)
+            rp.parse(body.decode('utf-8', errors='replace').splitlines())
+    # Hosts without any rules need no per-URL matching; callers treat None as allowed
+    if rp.allow_all or (not rp.disallow_all and not rp.entries and rp.default_entry is None):
+        return None
+    return rp
+
+def robots_allow(url, user_agent):
     parsed_url = urlparse(url)
-    robots_url = f"{parsed_url.scheme}://{parsed_url.netloc}/robots.txt"
-    rp = RobotFileParser()
-    rp.set_url(robots_url)
     try:
-        rp.read()
-        return rp.can_fetch("*", url)
+        rp = get_robots_parser(parsed_url.scheme, parsed_url.netloc)
     except Exception as e:
-        logger.warning(f"Error reading robots.txt for {url}: {e}")
-        return True  # Assume allowed if robots.txt can't be read
+        logger.warning(f"Error reading robots.txt for {parsed_url.netloc}: {e}")
+        return True  # robots.txt can't be read
+    if rp is None:
+        return True  # No rules
+    return rp.can_fetch(user_agent, url)
+
+# Standalone can_fetch function
+def can_fetch(url):
+    return robots_allow(url, "*")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     test_urls = [
         "https://en.wikipedia.org/wiki/Web_scraping",
         "https://example.com",